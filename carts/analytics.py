@@ -0,0 +1,109 @@
+"""
+Sales analytics, read from SalesRollup only.
+
+Units and revenue per period are summed by the database over the rollup rows.
+Price percentiles and histograms come from one query. It returns a
+``(category, price, units)`` row per distinct price. NumPy sorts these by
+category and price, so each category is a contiguous slice of the arrays. It
+then works out every category's statistics at once, with no Python loop over
+categories or rows.
+"""
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import SalesRollup
+
+PERIODS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+PERCENTILES = (25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+# Stands in for "no category" in the integer arrays
+NO_CATEGORY = -1
+
+
+def get_rollups(farmer=None, since=None, until=None):
+    rollups = SalesRollup.objects.all()
+    if farmer is not None:
+        rollups = rollups.filter(farmer=farmer)
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+    if until is not None:
+        rollups = rollups.filter(day__lte=until)
+    return rollups
+
+
+def get_series(rollups, period, group):
+    """Units and revenue per ``period`` and ``group`` (``'farmer'`` or ``'category'``), oldest first."""
+    return list(
+        rollups.annotate(period=PERIODS[period]('day')).values('period', group)
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .filter(units__gt=0).order_by('period', group)
+    )
+
+
+def group_bounds(groups):
+    """Start and end offsets of each run of equal values in the sorted ``groups``."""
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ends = np.r_[starts[1:], len(groups)]
+    return starts, ends
+
+
+def weighted_percentiles(prices, units, starts, ends, percentiles):
+    """
+    Nearest-rank percentiles of ``prices`` weighted by ``units``, for each
+    group of rows ``starts[i]:ends[i]`` (sorted by price within a group).
+    Returns a ``(groups, percentiles)`` array.
+    """
+    cumulative = np.cumsum(units)
+    before = cumulative[starts] - units[starts]
+    totals = cumulative[ends - 1] - before
+    # ceil(p * total / 100) in integers, and at least the first unit
+    ranks = np.maximum(-(-np.outer(totals, percentiles) // 100), 1)
+    return prices[np.searchsorted(cumulative, before[:, None] + ranks)]
+
+
+def histograms(prices, units, starts, ends, bins):
+    """
+    Units per equal-width price bin between each group's lowest and highest
+    price. Returns ``(edges, counts)`` shaped ``(groups, bins + 1)`` and
+    ``(groups, bins)``.
+    """
+    group = np.repeat(np.arange(len(starts)), ends - starts)
+    low, high = prices[starts], prices[ends - 1]
+    width = (high - low) / bins
+    safe_width = np.where(width > 0, width, 1)
+    index = np.clip(((prices - low[group]) / safe_width[group]).astype(np.int64), 0, bins - 1)
+    counts = np.bincount(group * bins + index, weights=units, minlength=len(starts) * bins)
+    edges = low[:, None] + width[:, None] * np.arange(bins + 1)
+    return edges, counts.reshape(len(starts), bins).astype(np.int64)
+
+
+def get_price_stats(rollups, percentiles=PERCENTILES, bins=HISTOGRAM_BINS):
+    """Unit-weighted price percentiles and histogram per category."""
+    rows = list(
+        rollups.values_list('category', 'price').annotate(total=Sum('units'))
+        .filter(total__gt=0).order_by()
+    )
+    if not rows:
+        return []
+    categories = np.fromiter(
+        (NO_CATEGORY if category is None else category for category, _, _ in rows), np.int64, len(rows)
+    )
+    prices = np.fromiter((price for _, price, _ in rows), np.float64, len(rows))
+    units = np.fromiter((total for _, _, total in rows), np.int64, len(rows))
+    order = np.lexsort((prices, categories))
+    categories, prices, units = categories[order], prices[order], units[order]
+
+    starts, ends = group_bounds(categories)
+    values = weighted_percentiles(prices, units, starts, ends, np.array(percentiles))
+    edges, counts = histograms(prices, units, starts, ends, bins)
+    totals = np.add.reduceat(units, starts)
+    return [
+        {
+            'category': None if categories[start] == NO_CATEGORY else int(categories[start]),
+            'units': int(totals[i]),
+            'percentiles': {f'p{p}': values[i, j] for j, p in enumerate(percentiles)},
+            'histogram': {'edges': edges[i].tolist(), 'counts': counts[i].tolist()},
+        }
+        for i, start in enumerate(starts)
+    ]
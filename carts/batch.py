@@ -0,0 +1,89 @@
+"""
+Batch cart updates: apply many add/set/remove operations in one transaction.
+
+The operations are folded in memory into a final quantity per product. Only
+the lines that actually change are written, with bulk_create, bulk_update and
+a single delete, and their stock holds are adjusted with one conditional
+UPDATE (``carts.inventory.reserve``). The number of queries stays the same
+however many operations the batch holds.
+"""
+from django.db import transaction
+
+from products.models import Product
+from .inventory import hold_expiry, reserve
+from .models import CartItem, StockHold
+
+ADD, SET, REMOVE = 'add', 'set', 'remove'
+
+
+@transaction.atomic
+def apply_operations(cart, operations):
+    """
+    Apply ``operations`` (dicts with ``op``, ``product_id`` and, for add/set,
+    ``quantity``) to ``cart``. Raises InsufficientStock without changing
+    anything if the new quantities can't all be held.
+
+    Returns ``(lines, removed)``: the created or updated CartItems and the
+    ids of the deleted ones.
+    """
+    items = {item.product_id: item for item in cart.items.select_for_update()}
+    quantities = {product_id: item.quantity for product_id, item in items.items()}
+    for operation in operations:
+        product_id = operation['product_id']
+        if operation['op'] == ADD:
+            quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+        elif operation['op'] == SET:
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities.pop(product_id, None)
+
+    changed = [
+        product_id for product_id in quantities.keys() | items.keys()
+        if quantities.get(product_id) != (items[product_id].quantity if product_id in items else None)
+    ]
+    if not changed:
+        return [], []
+
+    # Lock first, then read the holds: every hold change takes these locks.
+    list(Product.objects.select_for_update().filter(pk__in=changed).order_by('pk').values_list('pk'))
+    holds = {hold.product_id: hold for hold in StockHold.objects.filter(item__cart=cart, product_id__in=changed)}
+    held = {product_id: hold.quantity for product_id, hold in holds.items()}
+    reserve(
+        {product_id: quantities.get(product_id, 0) - held.get(product_id, 0) for product_id in changed},
+        cart_id=cart.pk, held=held,
+    )
+
+    created = [
+        CartItem(cart=cart, product_id=product_id, quantity=quantities[product_id])
+        for product_id in changed if product_id not in items
+    ]
+    updated = []
+    removed = []
+    for product_id in changed:
+        if product_id not in items:
+            continue
+        if product_id in quantities:
+            items[product_id].quantity = quantities[product_id]
+            updated.append(items[product_id])
+        else:
+            removed.append(items[product_id].pk)
+    CartItem.objects.bulk_create(created)
+    CartItem.objects.bulk_update(updated, ['quantity'])
+    if removed:
+        CartItem.objects.filter(pk__in=removed).delete()  # cascades to their holds
+
+    # Every remaining changed line holds its full quantity again.
+    expires_at = hold_expiry()
+    kept_holds = []
+    for product_id, hold in holds.items():
+        if product_id in quantities:
+            hold.quantity, hold.expires_at = quantities[product_id], expires_at
+            kept_holds.append(hold)
+    StockHold.objects.bulk_update(kept_holds, ['quantity', 'expires_at'])
+    lines = {item.product_id: item for item in [*created, *updated]}
+    StockHold.objects.bulk_create([
+        StockHold(item=lines[product_id], product_id=product_id, quantity=quantities[product_id], expires_at=expires_at)
+        for product_id in changed if product_id in quantities and product_id not in holds
+    ])
+    cart.bump_version()
+    return list(lines.values()), removed
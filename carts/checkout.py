@@ -0,0 +1,69 @@
+"""
+Checkout: turn a cart into an order in one transaction.
+
+The work is set-based, so it takes the same number of queries however many
+items the cart holds. The involved Product rows are locked in primary-key
+order, so two concurrent checkouts can't deadlock on each other. The stock
+decrement is a single conditional UPDATE (see ``carts.inventory``). It only
+matches rows that still have enough stock, counting the cart's own holds as
+available. That stops overselling even on databases without row locks
+(SQLite). Notifications are queued as a job rather than sent inline.
+"""
+from collections import Counter
+
+from django.db import transaction
+
+from jobs.queue import enqueue
+from products.dashboard import invalidate_dashboards
+from products.models import Product
+from products.summary import record_sale
+from .inventory import sell_stock
+from .models import FarmerOrder, Order, OrderItem, StockHold
+from .rollups import record_sale as record_rollup
+
+
+class EmptyCart(Exception):
+    pass
+
+
+@transaction.atomic
+def checkout(cart):
+    """Place an order for everything in ``cart`` and empty it."""
+    quantities = Counter()
+    for product_id, quantity in cart.items.values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    if not quantities:
+        raise EmptyCart()
+
+    products = Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk')
+    products = {product.pk: product for product in products}
+    # Read under the product locks, which every hold change takes first
+    holds = StockHold.objects.filter(item__cart=cart)
+    held = Counter()
+    for product_id, quantity in holds.values_list('product_id', 'quantity'):
+        held[product_id] += quantity
+    sell_stock(quantities, held)
+    record_sale(products, quantities)
+
+    total_amount = sum(products[product_id].price * quantity for product_id, quantity in quantities.items())
+    order = Order.objects.create(buyer_id=cart.buyer_id, total_amount=total_amount)
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product_id=product_id,
+            quantity=quantity,
+            price_at_time=products[product_id].price,
+        )
+        for product_id, quantity in quantities.items()
+    ])
+    farmer_ids = {product.farmer_id for product in products.values()}
+    FarmerOrder.objects.bulk_create([
+        FarmerOrder(farmer_id=farmer_id, order=order, created_at=order.created_at) for farmer_id in farmer_ids
+    ])
+    record_rollup(order, products, quantities)
+    # Notifications are written by the jobs worker; the job commits (or rolls back) with the order
+    enqueue('carts.notify_order', order_id=order.pk)
+    invalidate_dashboards(farmer_ids)  # the buyer's goes with the Order save
+    cart.items.all().delete()  # cascades to the holds sold above
+    cart.bump_version()
+    return order
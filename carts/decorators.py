@@ -1,20 +1,100 @@
-from guardian.core import ObjectPermissionChecker
-from rest_framework.status import HTTP_403_FORBIDDEN
+import hashlib
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, HTTP_422_UNPROCESSABLE_ENTITY
 from rest_framework.response import Response
-from .models import Cart
+from users.permissions import get_permission_checker
+from .models import Cart, IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
 
 
 def cart_obj_permission_required(view_func):
-    def _wrapper(request,*args, **kwargs):
+    @wraps(view_func)
+    def _wrapper(view, *args, **kwargs):
         pk = kwargs.get("pk")
         obj = Cart.objects.get(pk=pk)
 
-        user = request.request.user
-        checker = ObjectPermissionChecker(user_or_group=user)
+        checker = get_permission_checker(view.request)
+
+        if not (checker.has_perm(perm="carts.view_cart", obj=obj) or
+                checker.has_perm(perm="carts.delete_cart", obj=obj)):
+
+            return Response({"detail": "Permission denied"}, status=HTTP_403_FORBIDDEN)
+        return view_func(view, *args, **kwargs)
+    return _wrapper
+
+
+def get_fingerprint(request):
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.get_full_path(), data], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view_func):
+    """
+    Make a mutating view method safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key runs the view in a transaction that also
+    claims the key. Its response is stored unless it is a server error, and
+    retries replay it without running the view again. A concurrent duplicate
+    blocks on the key row until the first request finishes. Reusing a key
+    with a different request body gives 422. Requests without the header run
+    as before.
+    """
+    @wraps(view_func)
+    def _wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_func(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                status=HTTP_400_BAD_REQUEST,
+            )
+        fingerprint = get_fingerprint(request)
+        keys = IdempotencyKey.objects.filter(user_id=request.user.pk, key=key)
 
-        if checker.has_perm(perm="carts.view_cart",obj=obj) or \
-            checker.has_perm(perm="carts.delete_cart",obj=obj):
+        # Plain retries of a finished request stop here, after one lookup.
+        record = keys.first()
+        if record is None or record.status_code is None:
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        record = IdempotencyKey.objects.create(
+                            user_id=request.user.pk, key=key, fingerprint=fingerprint
+                        )
+                    claimed = True
+                except IntegrityError:
+                    # Another request holds the key: wait for it to finish.
+                    record = keys.select_for_update().get()
+                    claimed = False
+                if claimed:
+                    response = view_func(view, request, *args, **kwargs)
+                    if response.status_code >= 500:
+                        transaction.set_rollback(True)
+                        return response
+                    record.status_code = response.status_code
+                    record.response_body = response.data
+                    record.save(update_fields=["status_code", "response_body"])
+                    return response
 
-            return Response({"detail": "Permission denied"},status=HTTP_403_FORBIDDEN)
-        return view_func(request,*args, **kwargs)
-    return _wrapper
\ No newline at end of file
+        if record.fingerprint != fingerprint:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                status=HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return replay(record)
+    return _wrapper
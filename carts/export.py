@@ -0,0 +1,62 @@
+"""
+Streaming export of a farmer's sales.
+
+The rows are read with ``iterator()``: a server-side cursor on PostgreSQL,
+chunked fetches elsewhere. Each row is encoded as it arrives and handed
+straight to ``StreamingHttpResponse``. Memory therefore stays flat however
+many rows the farmer has. Cancelled orders are left out: their stock went
+back on sale, so they aren't sales.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import OrderItem
+
+CSV, JSONL = 'csv', 'jsonl'
+CONTENT_TYPES = {CSV: 'text/csv', JSONL: 'application/x-ndjson'}
+COLUMNS = ('order_id', 'created_at', 'product_id', 'product', 'quantity', 'price_at_time', 'buyer')
+CHUNK_SIZE = 2000
+CANCELLED = 'cancelled'
+
+
+class Echo:
+    """A file-like object csv.writer can write a single row into."""
+
+    def write(self, value):
+        return value
+
+
+def get_sales(farmer, since=None, until=None):
+    """
+    Iterate over ``farmer``'s order items as tuples of ``COLUMNS``, oldest first,
+    for orders placed on the dates ``since`` through ``until`` (inclusive).
+    """
+    items = OrderItem.objects.filter(product__farmer=farmer).exclude(order__status=CANCELLED)
+    # Whole-day bounds on the raw timestamp; a __date lookup would wrap the column in a function
+    if since is not None:
+        items = items.filter(order__created_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    if until is not None:
+        items = items.filter(order__created_at__lt=timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min)))
+    return items.order_by('order__created_at', 'order_id', 'pk').values_list(
+        'order_id', 'order__created_at', 'product_id', 'product__name', 'quantity', 'price_at_time',
+        'order__buyer__username',
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def encode_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+
+
+def encode_jsonl(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+ENCODERS = {CSV: encode_csv, JSONL: encode_jsonl}
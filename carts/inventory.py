@@ -0,0 +1,204 @@
+"""
+Stock holds.
+
+Adding an item to a cart holds its quantity for ``STOCK_HOLD_TTL`` seconds.
+Held units are counted in ``Product.quantity_reserved``, so a product's
+available stock is ``quantity_available - quantity_reserved``. Taking a hold
+is one conditional UPDATE on the product row, with no read-modify-write.
+That keeps the row lock short, so a hot product can serve many buyers at once.
+
+Every change to a product's holds goes through its product row. Taking a hold
+updates the row, and releasing holds locks it first. This keeps the counter
+equal to the sum of the product's StockHold rows. Expired holds are released
+lazily, when a buyer would otherwise be turned away. They are also released in
+bulk by the ``release_expired_holds`` management command.
+
+Cascade deletes are the exception: deleting a cart, a cart item or a buyer
+drops their StockHold rows without touching the counter. Checkout and the cart
+endpoints account for that themselves, but deletes from elsewhere (the admin,
+user deletion) leak reserved units. ``reconcile_reserved``, run by the
+``reconcile_stock_holds`` management command, recounts the counter from the
+StockHold rows to take them back.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from products.models import Product
+from .models import StockHold
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        # {product_id: quantity still available}
+        self.shortages = shortages
+        super().__init__(shortages)
+
+
+def adjust(quantities, field):
+    """Build an UPDATE value subtracting ``quantities[pk]`` from ``field`` per row."""
+    return Case(
+        *(When(pk=product_id, then=F(field) - quantity) for product_id, quantity in quantities.items()),
+        default=F(field),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def get_available(product_ids, held=None):
+    """Return ``{product_id: available}``, counting ``held`` units as available."""
+    held = held or {}
+    available = dict.fromkeys(product_ids, 0)
+    for product in Product.objects.filter(pk__in=product_ids).only('quantity_available', 'quantity_reserved'):
+        available[product.pk] = product.available_quantity + held.get(product.pk, 0)
+    return available
+
+
+def hold_expiry():
+    return timezone.now() + timedelta(seconds=settings.STOCK_HOLD_TTL)
+
+
+def reserve(deltas, cart_id=None, held=None):
+    """
+    Change ``quantity_reserved`` by ``{product_id: delta}`` in one conditional
+    UPDATE. An increase only applies if the product has that many free units.
+    Either every product changes or none does.
+
+    If an increase fails, expired holds from other carts (not ``cart_id``) on
+    those products are released and the UPDATE is retried once. If it still
+    fails, InsufficientStock reports the units this cart could have, counting
+    its own ``held`` units. Decreases must run under the caller's product row
+    locks.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    condition = Q()
+    for product_id, delta in deltas.items():
+        if delta > 0:
+            condition |= Q(pk=product_id, quantity_available__gte=F('quantity_reserved') + delta)
+        else:
+            condition |= Q(pk=product_id)
+    changes = {product_id: -delta for product_id, delta in deltas.items()}
+    increased = [product_id for product_id, delta in deltas.items() if delta > 0]
+
+    for retry in (True, False):
+        try:
+            with transaction.atomic():
+                updated = Product.objects.filter(condition).update(
+                    quantity_reserved=adjust(changes, 'quantity_reserved')
+                )
+                if updated != len(deltas):
+                    raise InsufficientStock({})
+            return
+        except InsufficientStock:
+            if not retry:
+                break
+            # Expired holds may be all that stands in the way.
+            expired = StockHold.objects.filter(expires_at__lte=timezone.now(), product_id__in=increased)
+            if cart_id is not None:
+                expired = expired.exclude(item__cart_id=cart_id)
+            release_holds(expired)
+
+    held = held or {}
+    free = get_available(increased)
+    raise InsufficientStock({
+        product_id: free[product_id] + held.get(product_id, 0)
+        for product_id in increased if free[product_id] < deltas[product_id]
+    })
+
+
+@transaction.atomic
+def hold_stock(item, quantity=None):
+    """
+    Hold ``quantity`` more units (default: all of ``item.quantity``) for the
+    saved cart ``item``, and restart the hold's expiry.
+    """
+    quantity = item.quantity if quantity is None else quantity
+    reserve({item.product_id: quantity}, cart_id=item.cart_id)
+    # reserve() locked the product row, so nothing else touches this hold now
+    expires_at = hold_expiry()
+    if not StockHold.objects.filter(item=item).update(quantity=F('quantity') + quantity, expires_at=expires_at):
+        StockHold.objects.create(item=item, product_id=item.product_id, quantity=quantity, expires_at=expires_at)
+
+
+@transaction.atomic
+def release_holds(holds):
+    """Delete the StockHold rows in ``holds`` and return their units to stock."""
+    product_ids = set(holds.values_list('product_id', flat=True))
+    if not product_ids:
+        return 0
+    # Lock first, then re-read: the holds may have changed while we waited.
+    list(Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk').values_list('pk'))
+    released = Counter()
+    hold_ids = []
+    for hold_id, product_id, quantity in holds.filter(product_id__in=product_ids).values_list(
+        'pk', 'product_id', 'quantity'
+    ):
+        hold_ids.append(hold_id)
+        released[product_id] += quantity
+    if hold_ids:
+        StockHold.objects.filter(pk__in=hold_ids).delete()
+        Product.objects.filter(pk__in=released).update(quantity_reserved=adjust(released, 'quantity_reserved'))
+    return len(hold_ids)
+
+
+def release_expired_holds(now=None, product_ids=None):
+    """Release holds that expired by ``now``, optionally only for ``product_ids``."""
+    holds = StockHold.objects.filter(expires_at__lte=now or timezone.now())
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    return release_holds(holds)
+
+
+@transaction.atomic
+def reconcile_reserved(product_ids):
+    """
+    Reset ``quantity_reserved`` of ``product_ids`` to the sum of their
+    StockHold rows. Returns how many products had drifted.
+    """
+    # Holds only change under their product's row lock, so the sums below are stable
+    reserved = dict(
+        Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk')
+        .values_list('pk', 'quantity_reserved')
+    )
+    held = Counter()
+    for product_id, quantity in StockHold.objects.filter(product_id__in=reserved).values_list('product_id', 'quantity'):
+        held[product_id] += quantity
+    drift = {
+        product_id: quantity - held[product_id]
+        for product_id, quantity in reserved.items() if quantity != held[product_id]
+    }
+    if drift:
+        Product.objects.filter(pk__in=drift).update(quantity_reserved=adjust(drift, 'quantity_reserved'))
+    return len(drift)
+
+
+def sell_stock(quantities, held):
+    """
+    Take ``quantities`` out of stock for a checkout that already holds
+    ``held`` units, converting those holds into sales. The product rows must
+    be locked by the caller. Either every product is updated or none is.
+    The units are also added to each product's ``units_sold``.
+    """
+    enough_stock = Q()
+    for product_id, quantity in quantities.items():
+        enough_stock |= Q(
+            pk=product_id,
+            quantity_available__gte=F('quantity_reserved') + (quantity - held.get(product_id, 0)),
+        )
+    updated = Product.objects.filter(enough_stock).update(
+        quantity_available=adjust(quantities, 'quantity_available'),
+        quantity_reserved=adjust(held, 'quantity_reserved'),
+        # adjust() subtracts, so negate the quantities to add them
+        units_sold=adjust({product_id: -quantity for product_id, quantity in quantities.items()}, 'units_sold'),
+    )
+    if updated != len(quantities):
+        available = get_available(quantities, held)
+        raise InsufficientStock({
+            product_id: available[product_id]
+            for product_id, quantity in quantities.items() if available[product_id] < quantity
+        })
@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from carts.models import Order
+from carts.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuilds (or backfills) the sales rollups from orders, a range of days per transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help='First day to rebuild (default: first order)')
+        parser.add_argument('--until', type=date.fromisoformat, help='Last day to rebuild (default: last order)')
+        parser.add_argument('--days', type=int, default=7, help='Days to rebuild per transaction')
+
+    def handle(self, *args, **options):
+        bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if bounds['first'] is None and not (options['since'] and options['until']):
+            self.stdout.write(self.style.SUCCESS("No orders to roll up."))
+            return
+        since = options['since'] or timezone.localdate(bounds['first'])
+        until = options['until'] or timezone.localdate(bounds['last'])
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1")
+        if since > until:
+            raise CommandError("--since must not be after --until")
+        rows = 0
+        start = since
+        while start <= until:
+            # Short transactions, so checkouts are never blocked for long
+            end = min(start + timedelta(days=options['days'] - 1), until)
+            rows += rebuild(start, end)
+            start = end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} sales rollup rows from {since} to {until}."))
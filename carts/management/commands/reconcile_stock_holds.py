@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from carts.inventory import reconcile_reserved
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recounts reserved stock from the cart stock holds, undoing cascade-delete leaks (run nightly, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Products to reconcile per transaction')
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            Product.objects.filter(Q(quantity_reserved__gt=0) | Q(stock_holds__isnull=False))
+            .order_by('pk').values_list('pk', flat=True).distinct()
+        )
+        batch_size = options['batch_size']
+        corrected = 0
+        for start in range(0, len(product_ids), batch_size):
+            # Each batch locks only its own products, and only briefly
+            corrected += reconcile_reserved(product_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled reserved stock of {len(product_ids)} products, {corrected} corrected."
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from carts.inventory import release_expired_holds
+from carts.models import StockHold
+
+
+class Command(BaseCommand):
+    help = "Releases expired cart stock holds back to available stock (run periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Products to release per transaction')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        released = 0
+        while True:
+            # Short transactions, a batch of products at a time, so buyers are never blocked for long
+            product_ids = list(
+                StockHold.objects.filter(expires_at__lte=now)
+                .order_by('product_id').values_list('product_id', flat=True).distinct()[:options['batch_size']]
+            )
+            if not product_ids:
+                break
+            released += release_expired_holds(now=now, product_ids=product_ids)
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired holds."))
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """
+    Fold duplicate (cart, product) lines into the oldest one, with the summed
+    quantity and a single hold for all of the lines' held units.
+    """
+    CartItem = apps.get_model('carts', 'CartItem')
+    StockHold = apps.get_model('carts', 'StockHold')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        items = CartItem.objects.filter(cart_id=duplicate['cart_id'], product_id=duplicate['product_id'])
+        holds = StockHold.objects.filter(item__in=items)
+        held = holds.aggregate(quantity=Sum('quantity'), expires_at=Max('expires_at'))
+        holds.delete()
+        items.exclude(pk=duplicate['keep']).delete()
+        items.update(quantity=duplicate['total'])
+        if held['quantity']:
+            # quantity_reserved is unchanged: the same units stay held
+            StockHold.objects.create(
+                item_id=duplicate['keep'], product_id=duplicate['product_id'],
+                quantity=held['quantity'], expires_at=held['expires_at'],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0004_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+    ]
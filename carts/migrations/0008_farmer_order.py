@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0007_cart_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmerOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('farmer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='farmer_orders', to='carts.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['farmer', 'created_at', 'order'], name='farmer_order_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('farmer', 'order'), name='unique_farmer_order')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def backfill_farmer_orders(apps, schema_editor):
+    """Link every existing order to the farmers whose products it contains."""
+    OrderItem = apps.get_model('carts', 'OrderItem')
+    FarmerOrder = apps.get_model('carts', 'FarmerOrder')
+    pairs = (
+        OrderItem.objects.values_list('product__farmer_id', 'order_id', 'order__created_at')
+        .order_by('order_id').distinct()
+    )
+    batch = []
+    for farmer_id, order_id, created_at in pairs.iterator(chunk_size=BATCH_SIZE):
+        batch.append(FarmerOrder(farmer_id=farmer_id, order_id=order_id, created_at=created_at))
+        if len(batch) == BATCH_SIZE:
+            FarmerOrder.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FarmerOrder.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def clear_farmer_orders(apps, schema_editor):
+    apps.get_model('carts', 'FarmerOrder').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0008_farmer_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_farmer_orders, clear_farmer_orders),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0011_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmerorder',
+            name='fulfilled',
+            field=models.BooleanField(default=False),
+        ),
+    ]
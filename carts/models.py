@@ -1,7 +1,12 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
-from products.models import Product
+from products.models import Category, Product
 
 User = get_user_model()
 
@@ -9,16 +14,101 @@ User = get_user_model()
 class Cart(models.Model):
     buyer = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every change to the items, so clients can tell if their copy is current
+    version = models.PositiveIntegerField(default=0)
     def __str__(self):
         return f"Cart for {self.buyer.username}"
 
+    def bump_version(self):
+        Cart.objects.filter(pk=self.pk).update(version=F('version') + 1)
+
+    def get_summary(self):
+        """Return the version and item totals in one aggregate query."""
+        return Cart.objects.filter(pk=self.pk).annotate(
+            item_count=Count('items'),
+            total_quantity=Coalesce(Sum('items__quantity'), 0),
+            subtotal=Coalesce(
+                Sum(F('items__quantity') * F('items__product__price'), output_field=models.DecimalField()),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(),
+            ),
+        ).values('version', 'item_count', 'total_quantity', 'subtotal').get()
+
+class CartItemManager(models.Manager):
+    def add(self, cart, product, quantity):
+        """
+        Add ``quantity`` of ``product`` to ``cart``, merging with the existing
+        line. On databases with ``INSERT ... ON CONFLICT`` this is a single
+        atomic statement.
+        """
+        connection = connections[self.db]
+        features = connection.features
+        if not (features.supports_update_conflicts_with_target and features.can_return_columns_from_insert):
+            return self._add_fallback(cart, product, quantity)
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (cart_id, product_id, quantity) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity '
+                f'RETURNING id, quantity',
+                [cart.pk, product.pk, quantity],
+            )
+            pk, total = cursor.fetchone()
+        item = self.model.from_db(self.db, ['id', 'cart_id', 'product_id', 'quantity'], [pk, cart.pk, product.pk, total])
+        item.cart, item.product = cart, product
+        return item
+
+    def _add_fallback(self, cart, product, quantity):
+        with transaction.atomic(using=self.db):
+            lines = self.filter(cart=cart, product=product)
+            if not lines.update(quantity=F('quantity') + quantity):
+                try:
+                    with transaction.atomic(using=self.db):
+                        return self.create(cart=cart, product=product, quantity=quantity)
+                except IntegrityError:
+                    # Lost the race to insert the line; add to the winner's row.
+                    lines.update(quantity=F('quantity') + quantity)
+            return lines.select_related('cart', 'product').get()
+
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE,related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    objects = CartItemManager()
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in cart"
 
+class StockHold(models.Model):
+    """Units of a product set aside for a cart item until ``expires_at``."""
+    item = models.OneToOneField(CartItem, on_delete=models.CASCADE, related_name='hold')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_holds')
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    expires_at = models.DateTimeField(db_index=True)
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held until {self.expires_at}"
+
+class OrderQuerySet(models.QuerySet):
+    def for_farmer(self, farmer):
+        """Orders containing ``farmer``'s products, newest first, read through FarmerOrder."""
+        return self.filter(farmer_orders__farmer=farmer).order_by('-farmer_orders__created_at', '-pk')
+
+    def for_buyer(self, buyer):
+        """``buyer``'s orders, newest first."""
+        return self.filter(buyer=buyer).order_by('-created_at', '-pk')
+
+    def get_totals(self):
+        """Lifetime ``order_count`` and ``total_spent``, leaving out cancelled orders."""
+        return self.exclude(status='cancelled').aggregate(
+            order_count=Count('pk'),
+            total_spent=Coalesce(Sum('total_amount'), Value(Decimal('0.00')), output_field=models.DecimalField()),
+        )
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -29,6 +119,12 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    objects = OrderQuerySet.as_manager()
+    class Meta:
+        indexes = [
+            # A buyer's order history, newest first, see carts.pagination
+            models.Index(fields=['buyer', 'created_at', 'id'], name='order_buyer_recent_idx'),
+        ]
     def __str__(self):
         return f"Order {self.id} by {self.buyer.username}"
 
@@ -38,4 +134,115 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     price_at_time = models.DecimalField(max_digits=10, decimal_places=2)
     def __str__(self):
-        return f"{self.quantity} x {self.product.name} in order {self.order.id}"
\ No newline at end of file
+        return f"{self.quantity} x {self.product.name} in order {self.order.id}"
+
+class FarmerOrder(models.Model):
+    """
+    One row per (farmer, order) the farmer sells into, so listing a farmer's
+    orders is a range scan on (farmer, created_at) instead of a join through
+    every order item. Written at checkout and by carts.signals.
+    """
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='farmer_orders')
+    # Copy of order.created_at, to order by without leaving the index
+    created_at = models.DateTimeField()
+    # Set when the farmer completes their part; the order completes once every farmer has
+    fulfilled = models.BooleanField(default=False)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['farmer', 'order'], name='unique_farmer_order'),
+        ]
+        indexes = [
+            models.Index(fields=['farmer', 'created_at', 'order'], name='farmer_order_recent_idx'),
+        ]
+    def __str__(self):
+        return f"Order {self.order_id} for farmer {self.farmer_id}"
+
+class SalesRollupManager(models.Manager):
+    def add(self, rows):
+        """
+        Add ``units`` and ``revenue`` to the rollup rows keyed by
+        ``(day, product_id, price)``, creating missing ones. ``rows`` are dicts
+        with those keys plus ``farmer_id`` and ``category_id``; negative
+        amounts take sales back out. On databases with ``INSERT ... ON
+        CONFLICT`` this is a single statement.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        connection = connections[self.db]
+        if not connection.features.supports_update_conflicts_with_target:
+            return self._add_fallback(rows)
+        ops = connection.ops
+        table = ops.quote_name(self.model._meta.db_table)
+        columns = ('day', 'product_id', 'price', 'farmer_id', 'category_id', 'units', 'revenue')
+        params = []
+        for row in rows:
+            params += [
+                ops.adapt_datefield_value(row['day']), row['product_id'], ops.adapt_decimalfield_value(row['price']),
+                row['farmer_id'], row['category_id'], row['units'], ops.adapt_decimalfield_value(row['revenue']),
+            ]
+        values = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES {values} '
+                f'ON CONFLICT (day, product_id, price) DO UPDATE SET '
+                f'units = {table}.units + excluded.units, revenue = {table}.revenue + excluded.revenue',
+                params,
+            )
+
+    def _add_fallback(self, rows):
+        with transaction.atomic(using=self.db):
+            for row in rows:
+                key = {'day': row['day'], 'product_id': row['product_id'], 'price': row['price']}
+                changes = {'units': F('units') + row['units'], 'revenue': F('revenue') + row['revenue']}
+                if self.filter(**key).update(**changes):
+                    continue
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.create(**row)
+                except IntegrityError:
+                    # Lost the race to insert the row; add to the winner's.
+                    self.filter(**key).update(**changes)
+
+
+class SalesRollup(models.Model):
+    """
+    Units and revenue sold per day, product and price, from orders that
+    weren't cancelled. Written at checkout and by carts.rollups; the
+    analytics endpoint reads only this table.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Copied from the product at sale time, to group without a join
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    objects = SalesRollupManager()
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product', 'price'], name='unique_sales_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['farmer', 'day'], name='sales_rollup_farmer_day_idx'),
+            models.Index(fields=['category', 'day'], name='sales_rollup_category_day_idx'),
+        ]
+    def __str__(self):
+        return f"{self.units} x {self.product_id} at {self.price} on {self.day}"
+
+class IdempotencyKey(models.Model):
+    """The stored outcome of a mutating request sent with an ``Idempotency-Key`` header."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+    def __str__(self):
+        return f"{self.key} for user {self.user_id}"
@@ -0,0 +1,7 @@
+from products.pagination import KeysetPagination
+
+
+class OrderCursorPagination(KeysetPagination):
+    # Buyers page over the (buyer, created_at, id) index on Order
+    ordering_fields = ('created_at',)
+    default_ordering = '-created_at'
@@ -0,0 +1,88 @@
+"""
+Sales rollups.
+
+SalesRollup keeps the units and revenue sold per day, product and price, so
+sales analytics never group over OrderItem. Checkout adds each order with
+``record_sale`` and cancellations take theirs back out with
+``record_cancellations``, each as one upsert. The ``rebuild_sales_rollups``
+command recomputes a range of days from the orders with ``rebuild``.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import OrderItem, SalesRollup
+
+CANCELLED = 'cancelled'
+
+
+def merge(lines):
+    """
+    Fold ``(day, product_id, price, farmer_id, category_id, quantity)`` lines
+    into rollup rows, one per ``(day, product_id, price)``.
+    """
+    rows = {}
+    for day, product_id, price, farmer_id, category_id, quantity in lines:
+        row = rows.setdefault((day, product_id, price), {
+            'day': day, 'product_id': product_id, 'price': price,
+            'farmer_id': farmer_id, 'category_id': category_id, 'units': 0, 'revenue': 0,
+        })
+        row['units'] += quantity
+        row['revenue'] += price * quantity
+    return rows.values()
+
+
+def record_sale(order, products, quantities):
+    """Add a new ``order`` to the rollups; ``products`` maps the ids in ``quantities`` to their rows."""
+    day = timezone.localdate(order.created_at)
+    SalesRollup.objects.add(merge(
+        (day, product_id, products[product_id].price, products[product_id].farmer_id,
+         products[product_id].category_id, quantity)
+        for product_id, quantity in quantities.items()
+    ))
+
+
+def record_cancellations(items):
+    """
+    Take cancelled order items back out of the rollups. ``items`` are dicts
+    with ``created_at`` (the order's), ``product_id``, ``farmer_id``,
+    ``category_id``, ``price_at_time`` and ``quantity``.
+    """
+    SalesRollup.objects.add(merge(
+        (timezone.localdate(item['created_at']), item['product_id'], item['price_at_time'],
+         item['farmer_id'], item['category_id'], -item['quantity'])
+        for item in items
+    ))
+
+
+@transaction.atomic
+def rebuild(since, until):
+    """Recompute the rollups for the days ``since`` through ``until`` (inclusive). Returns the row count."""
+    SalesRollup.objects.filter(day__gte=since, day__lte=until).delete()
+    start = timezone.make_aware(datetime.combine(since, time.min))
+    end = timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min))
+    sales = (
+        OrderItem.objects.filter(order__created_at__gte=start, order__created_at__lt=end)
+        .exclude(order__status=CANCELLED)
+        .values(
+            'product_id', day=TruncDate('order__created_at'), price=F('price_at_time'),
+            farmer_id=F('product__farmer_id'), category_id=F('product__category_id'),
+        )
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(F('price_at_time') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        .values_list('day', 'product_id', 'price', 'farmer_id', 'category_id', 'units', 'revenue')
+    )
+    rows = [
+        SalesRollup(
+            day=day, product_id=product_id, price=price, farmer_id=farmer_id,
+            category_id=category_id, units=units, revenue=revenue,
+        )
+        for day, product_id, price, farmer_id, category_id, units, revenue in sales
+    ]
+    SalesRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
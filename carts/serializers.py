@@ -1,24 +1,58 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .analytics import PERIODS
+from .batch import ADD, REMOVE, SET
+from .export import ENCODERS
+from .transitions import TRANSITIONS
 from .models import  Cart, CartItem, Order, OrderItem
 
+from config.eager_loading import eager_load
 from products.serializers import ProductSerializer
 from products.models import Product
 
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(), source='product', write_only=True
+        queryset=eager_load(Product.objects.all(), ProductSerializer), source='product', write_only=True
     )
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity']
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=[ADD, SET, REMOVE])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != REMOVE and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': f"Required for '{attrs['op']}'."})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True,read_only=True)
     class Meta:
         model = Cart
-        fields = ['id', 'buyer', 'items', 'created_at']
+        fields = ['id', 'buyer', 'items', 'created_at', 'version']
+
+class CartTotalsSerializer(serializers.Serializer):
+    item_count = serializers.IntegerField()
+    total_quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CartDeltaSerializer(serializers.Serializer):
+    """What changed in a cart mutation, for clients patching a local copy."""
+    version = serializers.IntegerField()
+    items = CartItemSerializer(many=True)
+    removed = serializers.ListField(child=serializers.IntegerField())
+    totals = CartTotalsSerializer(source='*')
+
+class OrderTotalsSerializer(serializers.Serializer):
+    order_count = serializers.IntegerField()
+    total_spent = serializers.DecimalField(max_digits=14, decimal_places=2)
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
@@ -27,8 +61,55 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'quantity', 'price_at_time']
 
 class OrderSerializer(serializers.ModelSerializer):
+    select_related_fields = ('buyer',)
     items = OrderItemSerializer(many=True, read_only=True)
     buyer = serializers.StringRelatedField()
     class Meta:
         model = Order
-        fields = ['id', 'buyer', 'status', 'total_amount', 'created_at', 'items']
\ No newline at end of file
+        fields = ['id', 'buyer', 'status', 'total_amount', 'created_at', 'items']
+class OrderTransitionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=500)
+    status = serializers.ChoiceField(choices=sorted(set().union(*TRANSITIONS.values())))
+
+class OrderTransitionResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    outcome = serializers.CharField()
+    status = serializers.CharField(allow_null=True)
+
+class DateRangeSerializer(serializers.Serializer):
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if 'since' in attrs and 'until' in attrs and attrs['since'] > attrs['until']:
+            raise serializers.ValidationError({'until': "Must not be before 'since'."})
+        return attrs
+
+class SalesExportSerializer(DateRangeSerializer):
+    output = serializers.ChoiceField(choices=sorted(ENCODERS), default='csv')
+
+class SalesAnalyticsQuerySerializer(DateRangeSerializer):
+    period = serializers.ChoiceField(choices=list(PERIODS), default='day')
+
+class SalesPeriodSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    farmer = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(required=False, allow_null=True)
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class PriceHistogramSerializer(serializers.Serializer):
+    edges = serializers.ListField(child=serializers.DecimalField(max_digits=10, decimal_places=2))
+    counts = serializers.ListField(child=serializers.IntegerField())
+
+class PriceStatsSerializer(serializers.Serializer):
+    category = serializers.IntegerField(allow_null=True)
+    units = serializers.IntegerField()
+    percentiles = serializers.DictField(child=serializers.DecimalField(max_digits=10, decimal_places=2))
+    histogram = PriceHistogramSerializer()
+
+class SalesAnalyticsSerializer(serializers.Serializer):
+    period = serializers.CharField()
+    by_farmer = SalesPeriodSerializer(many=True)
+    by_category = SalesPeriodSerializer(many=True)
+    price_stats = PriceStatsSerializer(many=True)
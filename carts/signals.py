@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import FarmerOrder, OrderItem
+
+
+@receiver(post_save, sender=OrderItem)
+def link_farmer_order(sender, instance, created, raw, **kwargs):
+    # Checkout bulk-creates its links; this covers items saved one at a time.
+    if not created or raw:
+        return
+    FarmerOrder.objects.bulk_create([FarmerOrder(
+        farmer_id=instance.product.farmer_id, order_id=instance.order_id, created_at=instance.order.created_at,
+    )], ignore_conflicts=True)
+
+
+@receiver(post_delete, sender=OrderItem)
+def unlink_farmer_order(sender, instance, **kwargs):
+    # Drop the links of farmers with no items left in the order.
+    remaining = OrderItem.objects.filter(order_id=instance.order_id).values('product__farmer')
+    FarmerOrder.objects.filter(order_id=instance.order_id).exclude(farmer__in=remaining).delete()
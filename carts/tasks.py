@@ -0,0 +1,32 @@
+"""
+Background work that follows checkout, run by the jobs worker so the order
+request never waits on it.
+"""
+from collections import defaultdict
+
+from jobs.queue import task
+from notifications.digest import notify
+from .models import Order
+
+
+def describe(items):
+    return '\n'.join(f"  {item.quantity} x {item.product.name} at {item.price_at_time}" for item in items)
+
+
+@task('carts.notify_order')
+def notify_order(order_id):
+    """Add the order to the buyer's next digest, and each farmer's lines to theirs."""
+    order = Order.objects.select_related('buyer').filter(pk=order_id).first()
+    if order is None:
+        return
+    items = list(order.items.select_related('product').order_by('pk'))
+    lines = defaultdict(list)
+    for item in items:
+        lines[item.product.farmer_id].append(item)
+    notify([
+        (order.buyer_id, f"Thanks for your order #{order.pk}:\n{describe(items)}\nTotal: {order.total_amount}"),
+        *(
+            (farmer_id, f"New order #{order.pk} from {order.buyer.username}:\n{describe(farmer_items)}")
+            for farmer_id, farmer_items in lines.items()
+        ),
+    ])
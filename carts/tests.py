@@ -1,10 +1,25 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth.models import User, Group, Permission
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
+from jobs.models import Job
 from users.models import UserProfile
-from products.models import Product, Category
-from .models import Cart, CartItem, Order, OrderItem
+from products.models import FarmerSummary, Product, Category
+from .inventory import InsufficientStock, hold_stock
+from .models import Cart, CartItem, FarmerOrder, IdempotencyKey, Order, OrderItem, SalesRollup, StockHold
 from guardian.shortcuts import assign_perm
 from django.urls import reverse
 from datetime import date
@@ -288,6 +303,357 @@ class OrderTests(APITestCase):
         self.assertEqual(Order.objects.count(), 1)
         self.assertEqual(OrderItem.objects.count(), 1)
 
+    def fill_cart(self, count, quantity=1):
+        """Helper to add ``count`` distinct products to the buyer's cart."""
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Extra {i}', price=1.00, category=self.category, quantity_available=10,
+                harvest_date=date(2025, 8, 1), expiry_date=date(2025, 12, 1), farmer=self.farmer
+            )
+            for i in range(count)
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=quantity) for product in products
+        ])
+        return products
+
+    def test_place_order_decrements_stock(self):
+        """Test that checkout takes the ordered quantity out of stock."""
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=5)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_amount'], '12.50')
+        self.assertEqual(response.data['items'][0]['quantity'], 5)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_available, 95)
+
+    def test_place_order_insufficient_stock(self):
+        """Test that checkout fails as a whole when any product is short."""
+        extra = self.fill_cart(1)[0]
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=101)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['products'], [{'id': self.product.id, 'quantity_available': 100}])
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(CartItem.objects.count(), 2)
+        extra.refresh_from_db()
+        self.assertEqual(extra.quantity_available, 10)
+
+    def test_place_order_last_unit_sold_once(self):
+        """Test that two buyers cannot both buy the last unit."""
+        Product.objects.filter(pk=self.product.pk).update(quantity_available=1)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        CartItem.objects.create(cart=Cart.objects.create(buyer=self.buyer2), product=self.product, quantity=1)
+        url = reverse('orders', kwargs={'version': 'v1'})
+        statuses = []
+        for user in (self.buyer, self.buyer2):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(user)}')
+            statuses.append(self.client.post(url, {}, format='json').status_code)
+        self.assertEqual(statuses, [status.HTTP_201_CREATED, status.HTTP_409_CONFLICT])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_available, 0)
+
+    def test_place_order_updates_farmer_summary(self):
+        """Test that checkout adds the sale to the farmer's dashboard summary."""
+        extra = self.fill_cart(1, quantity=4)[0]
+        Product.objects.filter(pk=self.product.pk).update(quantity_available=12)  # down to 10: low stock
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json')
+        summary = FarmerSummary.objects.get(farmer=self.farmer)
+        self.assertEqual(summary.revenue, Decimal('9.00'))
+        self.assertEqual(
+            (summary.units_sold, summary.order_count, summary.pending_order_count, summary.low_stock_count),
+            (6, 1, 1, 1),
+        )
+        self.assertEqual(Product.objects.get(pk=extra.pk).units_sold, 4)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).units_sold, 2)
+
+    @override_settings(DASHBOARD_CACHE_TTL=60)
+    def test_place_order_invalidates_dashboards(self):
+        """Test that checkout drops the cached dashboards of the buyer and the farmer."""
+        cache.clear()
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        dashboard = reverse('dashboard', kwargs={'version': 'v1'})
+        tokens = {user: self.authenticate(user) for user in (self.buyer, self.farmer)}
+        for user in tokens:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[user]}')
+            self.assertEqual(self.client.get(dashboard).data['recent_orders'], [])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[self.buyer]}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json')
+        for user in tokens:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[user]}')
+            self.assertEqual(len(self.client.get(dashboard).data['recent_orders']), 1)
+
+    def test_place_order_query_count(self):
+        """Test that checkout costs the same number of queries for 1 or 50 items."""
+        url = reverse('orders', kwargs={'version': 'v1'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        self.fill_cart(1)
+        self.client.post(url, {}, format='json')  # warm the content type cache
+        self.fill_cart(1)
+        with self.assertNumQueries(20):
+            self.client.post(url, {}, format='json')
+        self.fill_cart(50, quantity=2)
+        with self.assertNumQueries(20):
+            response = self.client.post(url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), 50)
+        self.assertEqual(response.data['total_amount'], '100.00')
+
+    def test_add_item_holds_stock(self):
+        """Test that adding to the cart holds stock until the item is removed."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'})
+        response = self.client.post(url, {'product_id': self.product.id, 'quantity': 60}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['items'][0]['product']['available_quantity'], 40)
+        self.assertEqual(StockHold.objects.get().quantity, 60)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer2)}')
+        response = self.client.post(url, {'product_id': self.product.id, 'quantity': 41}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['products'], [{'id': self.product.id, 'quantity_available': 40}])
+        self.assertEqual(CartItem.objects.count(), 1)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        item_id = CartItem.objects.get().id
+        self.client.delete(url, {'item_id': item_id}, format='json')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_reserved, 0)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_add_existing_product_merges_line(self):
+        """Test that adding a product already in the cart increments its line and hold."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'})
+        self.client.post(url, {'product_id': self.product.id, 'quantity': 2}, format='json')
+        response = self.client.post(url, {'product_id': self.product.id, 'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['quantity'] for item in response.data['items']], [5])
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+        self.assertEqual(StockHold.objects.get().quantity, 5)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_reserved, 5)
+
+    def test_add_item_without_quantity_adds_one(self):
+        """Test that leaving out the quantity adds a single unit."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'})
+        response = self.client.post(url, {'product_id': self.product.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['quantity'] for item in response.data['items']], [1])
+        self.assertEqual(StockHold.objects.get().quantity, 1)
+
+    def test_add_item_fallback_without_on_conflict(self):
+        """Test the update-then-insert path used by databases without ON CONFLICT."""
+        first = CartItem.objects._add_fallback(self.cart, self.product, 2)
+        second = CartItem.objects._add_fallback(self.cart, self.product, 3)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(second.quantity, 5)
+
+    def test_batch_update_cart(self):
+        """Test that one PATCH applies add, set and remove operations with their holds."""
+        extra, gone = self.fill_cart(2, quantity=3)
+        CartItem.objects.filter(cart=self.cart).delete()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'})
+        self.client.post(url, {'product_id': gone.id, 'quantity': 3}, format='json')
+        self.client.post(url, {'product_id': extra.id, 'quantity': 3}, format='json')
+        operations = [
+            {'op': 'add', 'product_id': self.product.id, 'quantity': 2},
+            {'op': 'add', 'product_id': self.product.id, 'quantity': 4},
+            {'op': 'set', 'product_id': extra.id, 'quantity': 1},
+            {'op': 'remove', 'product_id': gone.id},
+        ]
+        response = self.client.patch(url, {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted((item['product']['id'], item['quantity']) for item in response.data['items']),
+            [(self.product.id, 6), (extra.id, 1)],
+        )
+        self.assertEqual(
+            dict(StockHold.objects.values_list('product_id', 'quantity')), {self.product.id: 6, extra.id: 1}
+        )
+        self.assertEqual(
+            dict(Product.objects.values_list('id', 'quantity_reserved')),
+            {self.product.id: 6, extra.id: 1, gone.id: 0},
+        )
+
+    def test_batch_update_is_all_or_nothing(self):
+        """Test that a batch with one unavailable quantity changes nothing."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'})
+        extra = self.fill_cart(1)[0]
+        CartItem.objects.filter(cart=self.cart).delete()
+        operations = [
+            {'op': 'add', 'product_id': extra.id, 'quantity': 5},
+            {'op': 'set', 'product_id': self.product.id, 'quantity': 101},
+        ]
+        response = self.client.patch(url, {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['products'], [{'id': self.product.id, 'quantity_available': 100}])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(Product.objects.filter(quantity_reserved__gt=0).exists())
+
+        response = self.client.patch(url, {'operations': [{'op': 'add', 'product_id': 0, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['products'], [0])
+
+    def test_batch_update_query_count(self):
+        """Test that a batch costs the same number of queries for 1 or 30 products."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'})
+
+        def sync(products):
+            operations = [{'op': 'set', 'product_id': product.id, 'quantity': 2} for product in products]
+            return self.client.patch(url, {'operations': operations}, format='json')
+
+        sync(self.fill_cart(1))  # warm the content type cache
+        products = self.fill_cart(1)
+        CartItem.objects.filter(cart=self.cart).delete()
+        with self.assertNumQueries(15):
+            sync(products)
+        products = self.fill_cart(30)
+        CartItem.objects.filter(cart=self.cart).delete()
+        with self.assertNumQueries(15):
+            response = sync(products)
+        self.assertEqual(len(response.data['items']), 30)
+
+    def test_cart_mutation_delta_response(self):
+        """Test that ?response=delta returns only the change, the version and totals."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'}) + '?response=delta'
+        response = self.client.post(url, {'product_id': self.product.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual([item['quantity'] for item in response.data['items']], [2])
+        self.assertEqual(response.data['items'][0]['product']['available_quantity'], 98)
+        self.assertEqual(response.data['removed'], [])
+        self.assertEqual(response.data['totals'], {'item_count': 1, 'total_quantity': 2, 'subtotal': '5.00'})
+
+        extra = self.fill_cart(1)[0]
+        CartItem.objects.filter(product=extra).delete()
+        operations = [{'op': 'set', 'product_id': extra.id, 'quantity': 3}]
+        response = self.client.patch(url, {'operations': operations}, format='json')
+        self.assertEqual(response.data['version'], 2)
+        self.assertEqual([item['product']['id'] for item in response.data['items']], [extra.id])
+        self.assertEqual(response.data['items'][0]['product']['available_quantity'], 7)
+        self.assertEqual(response.data['totals']['subtotal'], '8.00')
+
+        item_id = CartItem.objects.get(product=self.product).id
+        response = self.client.delete(url, {'item_id': item_id}, format='json')
+        self.assertEqual(response.data, {
+            'version': 3, 'items': [], 'removed': [item_id],
+            'totals': {'item_count': 1, 'total_quantity': 3, 'subtotal': '3.00'},
+        })
+        response = self.client.get(reverse('cart', kwargs={'version': 'v1'}))
+        self.assertEqual(response.data['version'], 3)
+
+    def test_cart_delta_query_count(self):
+        """Test that a delta-mode add costs the same however large the cart is."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'}) + '?response=delta'
+        self.client.post(url, {'product_id': self.product.id, 'quantity': 1}, format='json')
+        with self.assertNumQueries(14):
+            self.client.post(url, {'product_id': self.product.id, 'quantity': 1}, format='json')
+        self.fill_cart(30)
+        with self.assertNumQueries(14):
+            response = self.client.post(url, {'product_id': self.product.id, 'quantity': 1}, format='json')
+        self.assertEqual(response.data['totals']['item_count'], 31)
+
+    def test_expired_hold_released_on_demand(self):
+        """Test that an expired hold gives way to another buyer."""
+        hold_stock(CartItem.objects.create(cart=self.cart, product=self.product, quantity=100))
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        cart2 = Cart.objects.create(buyer=self.buyer2)
+        hold_stock(CartItem.objects.create(cart=cart2, product=self.product, quantity=30))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_reserved, 30)
+        self.assertEqual(list(StockHold.objects.values_list('item__cart', flat=True)), [cart2.id])
+
+    def test_release_expired_holds_command(self):
+        """Test that the sweep releases only expired holds."""
+        hold_stock(CartItem.objects.create(cart=self.cart, product=self.product, quantity=10))
+        hold_stock(CartItem.objects.get(product=self.fill_cart(1, quantity=5)[0]))
+        cart2 = Cart.objects.create(buyer=self.buyer2)
+        hold_stock(CartItem.objects.create(cart=cart2, product=self.product, quantity=20))
+        StockHold.objects.filter(quantity__lt=20).update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('release_expired_holds', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(StockHold.objects.values_list('quantity', flat=True)), [20])
+        self.assertEqual(
+            dict(Product.objects.values_list('name', 'quantity_reserved')), {'Carrots': 20, 'Extra 0': 0}
+        )
+
+    def test_reconcile_stock_holds_command(self):
+        """Test that holds removed by a cascade delete are taken back out of reserved stock."""
+        hold_stock(CartItem.objects.create(cart=self.cart, product=self.product, quantity=10))
+        cart2 = Cart.objects.create(buyer=self.buyer2)
+        hold_stock(CartItem.objects.create(cart=cart2, product=self.product, quantity=20))
+        cart2.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_reserved, 30)
+        out = StringIO()
+        call_command('reconcile_stock_holds', batch_size=1, stdout=out)
+        self.assertIn('1 corrected', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_reserved, 10)
+
+    def test_place_order_converts_holds(self):
+        """Test that checkout turns the cart's holds into sold stock."""
+        hold_stock(CartItem.objects.create(cart=self.cart, product=self.product, quantity=70))
+        Product.objects.filter(pk=self.product.pk).update(quantity_reserved=F('quantity_reserved') + 30)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity_available, self.product.quantity_reserved), (30, 30))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_place_order_retry_replays_response(self):
+        """Test that retrying checkout with the same Idempotency-Key replays the first order."""
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('orders', kwargs={'version': 'v1'})
+        first = self.client.post(url, {}, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with self.assertNumQueries(1):
+            retry = self.client.post(url, {}, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity_available, 98)
+
+    def test_add_item_retry_and_key_reuse(self):
+        """Test that cart retries add one item and a reused key with another body is rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('cart', kwargs={'version': 'v1'})
+        data = {'product_id': self.product.id, 'quantity': 2}
+        for _ in range(3):
+            response = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(CartItem.objects.count(), 1)
+        response = self.client.post(url, {**data, 'quantity': 3}, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        # Keys are per user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer2)}')
+        response = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_purge_idempotency_keys_command(self):
+        """Test that the purge deletes only keys past their TTL."""
+        old = IdempotencyKey.objects.create(user=self.buyer, key='old', fingerprint='x', status_code=201)
+        IdempotencyKey.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+        IdempotencyKey.objects.create(user=self.buyer, key='new', fingerprint='x', status_code=201)
+        call_command('purge_idempotency_keys', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
     def test_place_order_empty_cart(self):
         """Test that a buyer cannot place an order with an empty cart."""
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
@@ -329,6 +695,48 @@ class OrderTests(APITestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['items'][0]['product']['id'], self.product.id)
 
+    def test_farmer_orders_linked_at_checkout(self):
+        """Test that checkout links the order to each farmer whose products it contains."""
+        other = self.fill_cart(1)[0]
+        Product.objects.filter(pk=other.pk).update(farmer=self.buyer2)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        order_id = self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json').data['id']
+        self.assertEqual(
+            set(FarmerOrder.objects.filter(order_id=order_id).values_list('farmer_id', flat=True)),
+            {self.farmer.id, self.buyer2.id},
+        )
+        self.assertEqual(list(Order.objects.for_farmer(self.farmer).values_list('id', flat=True)), [order_id])
+
+    def test_farmer_orders_follow_order_items(self):
+        """Test that farmer links follow order items saved and deleted one at a time."""
+        older = Order.objects.create(buyer=self.buyer, total_amount=5.00)
+        newer = Order.objects.create(buyer=self.buyer, total_amount=5.00)
+        items = [
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, price_at_time=2.50)
+            for order in (older, newer)
+        ]
+        OrderItem.objects.create(order=newer, product=self.product, quantity=1, price_at_time=2.50)
+        self.assertEqual(list(Order.objects.for_farmer(self.farmer)), [newer, older])
+        items[0].delete()
+        self.assertEqual(list(Order.objects.for_farmer(self.farmer)), [newer])
+        items[1].delete()  # the farmer still has an item in this order
+        self.assertEqual(list(Order.objects.for_farmer(self.farmer)), [newer])
+
+    def test_get_order_history_paginated(self):
+        """Test that order history pages newest first with cursors."""
+        self.add_orders(5)
+        expected = list(Order.objects.filter(buyer=self.buyer).order_by('-created_at', '-pk').values_list('id', flat=True))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('orders', kwargs={'version': 'v1'}) + '?page_size=2'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
     def test_buyer_access_other_orders(self):
         """Test that a buyer cannot see another buyer's orders."""
         cart,_ = Cart.objects.get_or_create(buyer=self.buyer)
@@ -359,4 +767,356 @@ class OrderTests(APITestCase):
         self.assertEqual(order_item.order, order)
         self.assertEqual(order_item.product, self.product)
         self.assertEqual(order_item.quantity, 2)
-        self.assertEqual(order_item.price_at_time, 2.50)
\ No newline at end of file
+        self.assertEqual(order_item.price_at_time, 2.50)
+    def add_orders(self, count):
+        """Helper to create orders for the buyer with one item each."""
+        for _ in range(count):
+            order = Order.objects.create(buyer=self.buyer, total_amount=5.00)
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, price_at_time=2.50)
+
+    def test_get_order_history_query_count(self):
+        """Test that order history costs a fixed number of queries for buyers and farmers."""
+        url = reverse('orders', kwargs={'version': 'v1'})
+        self.add_orders(1)
+        for user in (self.buyer, self.farmer):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(user)}')
+            with self.assertNumQueries(2):
+                self.client.get(url)
+        self.add_orders(20)
+        for user in (self.buyer, self.farmer):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(user)}')
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data), 21)
+
+    def transition(self, ids, status_name):
+        return self.client.post(
+            reverse('order_transitions', kwargs={'version': 'v1'}), {'ids': ids, 'status': status_name}, format='json'
+        )
+
+    def test_transition_orders_outcomes(self):
+        """Test that a bulk transition reports an outcome for every id."""
+        self.add_orders(2)
+        pending, completed = Order.objects.order_by('pk')
+        Order.objects.filter(pk=completed.pk).update(status='completed')
+        other_farmer = User.objects.create_user(username='farmer2', password='password123')
+        other = Order.objects.create(buyer=self.buyer, total_amount=1.00)
+        OrderItem.objects.create(
+            order=other, product=Product.objects.create(
+                name='Beets', price=1.00, category=self.category, quantity_available=10,
+                harvest_date=date(2025, 8, 1), expiry_date=date(2025, 12, 1), farmer=other_farmer,
+            ), quantity=1, price_at_time=1.00,
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        response = self.transition([pending.pk, completed.pk, other.pk, 999, pending.pk], 'completed')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'id': pending.pk, 'outcome': 'updated', 'status': 'completed'},
+            {'id': completed.pk, 'outcome': 'invalid_transition', 'status': 'completed'},
+            {'id': other.pk, 'outcome': 'not_found', 'status': None},
+            {'id': 999, 'outcome': 'not_found', 'status': None},
+        ])
+        self.assertEqual(
+            dict(Order.objects.values_list('pk', 'status')),
+            {pending.pk: 'completed', completed.pk: 'completed', other.pk: 'pending'},
+        )
+        self.assertEqual(self.transition([pending.pk], 'pending').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cancel_orders_restocks_and_updates_summary(self):
+        """Test that cancelling returns stock and takes the sale off the farmer's summary."""
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=5)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        order_id = self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json').data['id']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        self.transition([order_id], 'cancelled')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity_available, self.product.units_sold), (100, 0))
+        summary = FarmerSummary.objects.get(farmer=self.farmer)
+        self.assertEqual(summary.revenue, Decimal('0.00'))
+        self.assertEqual((summary.units_sold, summary.order_count, summary.pending_order_count), (0, 0, 0))
+        self.assertEqual(self.transition([order_id], 'completed').data['results'][0]['outcome'], 'invalid_transition')
+
+    def test_transition_orders_mixed_farmers_forbidden(self):
+        """Test that a farmer cannot move an order that also holds another farmer's items."""
+        other_farmer = User.objects.create_user(username='farmer2', password='password123')
+        beets = Product.objects.create(
+            name='Beets', price=1.00, category=self.category, quantity_available=10,
+            harvest_date=date(2025, 8, 1), expiry_date=date(2025, 12, 1), farmer=other_farmer,
+        )
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=beets, quantity=3)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        order_id = self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json').data['id']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        response = self.transition([order_id], 'cancelled')
+        self.assertEqual(response.data['results'], [{'id': order_id, 'outcome': 'forbidden', 'status': 'pending'}])
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'pending')
+        beets.refresh_from_db()
+        self.assertEqual(beets.quantity_available, 7)
+        summary = FarmerSummary.objects.get(farmer=other_farmer)
+        self.assertEqual((summary.units_sold, summary.order_count), (3, 1))
+
+    def test_transition_orders_mixed_farmers_complete_in_turn(self):
+        """Test that a shared order completes once every farmer has completed their part."""
+        other_farmer = User.objects.create_user(username='farmer2', password='password123')
+        UserProfile.objects.create(user=other_farmer, role='farmer')
+        other_farmer.groups.add(self.farmers_group)
+        beets = Product.objects.create(
+            name='Beets', price=1.00, category=self.category, quantity_available=10,
+            harvest_date=date(2025, 8, 1), expiry_date=date(2025, 12, 1), farmer=other_farmer,
+        )
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=beets, quantity=3)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        order_id = self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json').data['id']
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        for _ in range(2):
+            response = self.transition([order_id], 'completed')
+            self.assertEqual(response.data['results'], [{'id': order_id, 'outcome': 'fulfilled', 'status': 'pending'}])
+        self.assertEqual(FarmerSummary.objects.get(farmer=self.farmer).pending_order_count, 1)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(other_farmer)}')
+        response = self.transition([order_id], 'completed')
+        self.assertEqual(response.data['results'], [{'id': order_id, 'outcome': 'updated', 'status': 'completed'}])
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'completed')
+        for farmer in (self.farmer, other_farmer):
+            summary = FarmerSummary.objects.get(farmer=farmer)
+            self.assertEqual((summary.order_count, summary.pending_order_count), (1, 0))
+        self.assertEqual(self.transition([order_id], 'cancelled').data['results'][0]['outcome'], 'invalid_transition')
+
+    def test_transition_orders_query_count(self):
+        """Test that a bulk transition costs the same for 1 or 20 orders."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        self.add_orders(1)
+        ids = list(Order.objects.values_list('pk', flat=True))
+        with self.assertNumQueries(10):
+            self.transition(ids, 'cancelled')
+        self.add_orders(20)
+        ids = list(Order.objects.filter(status='pending').values_list('pk', flat=True))
+        with self.assertNumQueries(10):
+            response = self.transition(ids, 'cancelled')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_transition_orders_buyer_denied(self):
+        """Test that buyers cannot change order status."""
+        self.add_orders(1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.transition([Order.objects.get().pk], 'cancelled')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Order.objects.get().status, 'pending')
+
+    def export(self, **params):
+        response = self.client.get(reverse('sales_export', kwargs={'version': 'v1'}), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_sales_export_csv_and_jsonl(self):
+        """Test that farmers can stream their sales as CSV or JSON lines."""
+        self.add_orders(2)
+        first = Order.objects.order_by('pk').first()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        rows = list(csv.reader(StringIO(self.export())))
+        self.assertEqual(rows[0], ['order_id', 'created_at', 'product_id', 'product', 'quantity', 'price_at_time', 'buyer'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][0], str(first.pk))
+        self.assertEqual(rows[1][3:], ['Carrots', '2', '2.50', 'buyer1'])
+        lines = [json.loads(line) for line in self.export(output='jsonl').splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['price_at_time'], '2.50')
+        self.assertEqual(lines[0]['buyer'], 'buyer1')
+
+    def test_sales_export_date_range(self):
+        """Test that the export only includes orders placed within the date range."""
+        self.add_orders(2)
+        old = Order.objects.order_by('pk').first()
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        today = timezone.now().date()
+        self.assertEqual(len(self.export(since=today.isoformat()).splitlines()), 2)
+        self.assertEqual(len(self.export(until=(today - timedelta(days=10)).isoformat()).splitlines()), 2)
+        self.assertEqual(len(self.export(since=today.isoformat(), until=today.isoformat()).splitlines()), 2)
+        response = self.client.get(
+            reverse('sales_export', kwargs={'version': 'v1'}),
+            {'since': today.isoformat(), 'until': (today - timedelta(days=1)).isoformat()},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sales_export_skips_cancelled_orders(self):
+        """Test that items from cancelled orders are not exported as sales."""
+        self.add_orders(2)
+        cancelled, kept = Order.objects.order_by('pk')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        self.transition([cancelled.pk], 'cancelled')
+        rows = list(csv.reader(StringIO(self.export())))
+        self.assertEqual([row[0] for row in rows[1:]], [str(kept.pk)])
+
+    def test_sales_export_buyer_denied(self):
+        """Test that buyers cannot export sales."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(reverse('sales_export', kwargs={'version': 'v1'}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def place_order(self, product, quantity):
+        """Helper to check out a single line as the buyer."""
+        CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        return self.client.post(reverse('orders', kwargs={'version': 'v1'}), {}, format='json').data['id']
+
+    def rollups(self):
+        return list(SalesRollup.objects.order_by('product_id', 'price').values_list('product_id', 'price', 'units', 'revenue'))
+
+    def test_sales_rollups_follow_checkout_and_cancel(self):
+        """Test that checkout adds to the sales rollups and cancelling takes it back out."""
+        first = self.place_order(self.product, 2)
+        self.place_order(self.product, 3)
+        self.assertEqual(self.rollups(), [(self.product.pk, Decimal('2.50'), 5, Decimal('12.50'))])
+        self.assertEqual(SalesRollup.objects.get().day, timezone.localdate())
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        self.transition([first], 'cancelled')
+        self.assertEqual(self.rollups(), [(self.product.pk, Decimal('2.50'), 3, Decimal('7.50'))])
+
+    def test_rebuild_sales_rollups_command(self):
+        """Test that rebuilding the rollups from orders matches the ones kept at checkout."""
+        self.place_order(self.product, 2)
+        Product.objects.filter(pk=self.product.pk).update(price=3.00)
+        self.place_order(self.product, 1)
+        expected = self.rollups()
+        self.assertEqual(len(expected), 2)
+        SalesRollup.objects.update(units=0, revenue=0)
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), expected)
+
+    def analytics(self, **params):
+        return self.client.get(reverse('sales_analytics', kwargs={'version': 'v1'}), params)
+
+    def test_sales_analytics(self):
+        """Test per-period series and unit-weighted price statistics per category."""
+        fruit = Category.objects.create(name='Fruit')
+        apples = Product.objects.create(
+            name='Apples', price=1.00, category=fruit, quantity_available=100,
+            harvest_date=date(2025, 8, 1), expiry_date=date(2025, 12, 1), farmer=self.farmer,
+        )
+        self.place_order(self.product, 1)
+        Product.objects.filter(pk=self.product.pk).update(price=4.00)
+        self.place_order(self.product, 3)
+        self.place_order(apples, 2)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        response = self.analytics(period='week')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['period'], 'week')
+        self.assertEqual(
+            [(row['farmer'], row['units'], row['revenue']) for row in response.data['by_farmer']],
+            [(self.farmer.pk, 6, '16.50')],
+        )
+        self.assertEqual(
+            sorted((row['category'], row['units'], row['revenue']) for row in response.data['by_category']),
+            [(self.category.pk, 4, '14.50'), (fruit.pk, 2, '2.00')],
+        )
+        stats = {row['category']: row for row in response.data['price_stats']}
+        vegetables = stats[self.category.pk]
+        self.assertEqual(vegetables['units'], 4)
+        self.assertEqual(vegetables['percentiles'], {'p25': '2.50', 'p50': '4.00', 'p75': '4.00', 'p90': '4.00'})
+        self.assertEqual(vegetables['histogram']['counts'], [1] + [0] * 8 + [3])
+        self.assertEqual(vegetables['histogram']['edges'][0], '2.50')
+        self.assertEqual(vegetables['histogram']['edges'][-1], '4.00')
+        self.assertEqual(stats[fruit.pk]['histogram']['counts'], [2] + [0] * 9)
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        empty = self.analytics(since=tomorrow).data
+        self.assertEqual((empty['by_farmer'], empty['price_stats']), ([], []))
+        self.assertEqual(self.analytics(period='year').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sales_analytics_scope(self):
+        """Test that farmers only see their own sales, staff see everyone's and buyers are denied."""
+        self.place_order(self.product, 1)
+        other_farmer = User.objects.create_user(username='farmer2', password='password123')
+        UserProfile.objects.create(user=other_farmer, role='farmer')
+        other_farmer.groups.add(self.farmers_group)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(other_farmer)}')
+        self.assertEqual(self.analytics().data['by_farmer'], [])
+        admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(admin)}')
+        self.assertEqual(len(self.analytics().data['by_farmer']), 1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        self.assertEqual(self.analytics().status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(NOTIFICATION_DIGEST_WINDOW=0)
+    def test_checkout_notifications_sent_as_digests(self):
+        """Test that checkout queues a job, and its notifications go out as one digest per user."""
+        self.buyer.email, self.farmer.email = 'buyer1@example.com', 'farmer1@example.com'
+        User.objects.bulk_update([self.buyer, self.farmer], ['email'])
+        order_ids = [self.place_order(self.product, 2), self.place_order(self.product, 1)]
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            list(Job.objects.order_by('pk').values_list('name', 'payload')),
+            [('carts.notify_order', {'order_id': order_id}) for order_id in order_ids],
+        )
+        call_command('run_jobs', '--once', stdout=StringIO())
+        call_command('send_notification_digests', stdout=StringIO())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['buyer1@example.com', 'farmer1@example.com'])
+        farmer_digest = next(message for message in mail.outbox if message.to == ['farmer1@example.com'])
+        self.assertIn(f'New order #{order_ids[0]} from buyer1', farmer_digest.body)
+        self.assertIn('2 x Carrots at 2.50', farmer_digest.body)
+        self.assertIn(f'New order #{order_ids[1]} from buyer1', farmer_digest.body)
+
+    def test_get_cart_query_count(self):
+        """Test that reading the cart costs a fixed number of queries."""
+        url = reverse('cart', kwargs={'version': 'v1'})
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        self.fill_cart(10)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['items']), 11)
+
+
+class StockHoldConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        farmer = User.objects.create_user(username='farmer1', password='password123')
+        self.product = Product.objects.create(
+            name='Strawberries', price=4.00, quantity_available=25,
+            harvest_date=date(2025, 8, 1), expiry_date=date(2025, 12, 1), farmer=farmer
+        )
+        self.items = [
+            CartItem.objects.create(
+                cart=Cart.objects.create(buyer=User.objects.create_user(username=f'buyer{i}')),
+                product=self.product, quantity=1,
+            )
+            for i in range(60)
+        ]
+
+    def test_concurrent_holds_never_oversell(self):
+        """Test that 60 buyers racing for 25 units get exactly 25 holds."""
+        results = []
+        start = threading.Barrier(len(self.items))
+
+        def buy(item):
+            start.wait()
+            try:
+                while True:
+                    try:
+                        hold_stock(item)
+                        results.append(True)
+                        return
+                    except InsufficientStock:
+                        results.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting; retry like a client would
+                        continue
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(item,)) for item in self.items]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(results.count(True), 25)
+        self.assertEqual(self.product.quantity_reserved, 25)
+        self.assertEqual(StockHold.objects.count(), 25)
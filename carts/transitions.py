@@ -0,0 +1,111 @@
+"""
+Order state machine and bulk status transitions.
+
+An order starts ``pending`` and the farmers selling into it complete or
+cancel it. Completed and cancelled orders are final. Each farmer completes
+their own part of an order (``FarmerOrder.fulfilled``), and the order itself
+completes once every farmer has. Only a farmer selling every item in an
+order may cancel it; an order shared with other farmers can't be cancelled
+by any one of them, since that would return the others' stock too.
+
+A batch of orders is checked and moved in a fixed number of queries,
+whatever its size. The orders the farmer sells into are locked and read in
+one query. The valid ones then move with a single
+``UPDATE ... WHERE status IN (...)``. Cancelling an order returns its units
+to stock and takes its sales out of the rollups. Dashboard summaries are
+adjusted for the whole batch at once (see
+``products.summary.record_status_changes``).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from products.dashboard import invalidate_dashboards
+from products.models import Product
+from products.summary import record_status_changes
+from .inventory import adjust
+from .models import FarmerOrder, Order, OrderItem
+from .rollups import record_cancellations
+
+PENDING, COMPLETED, CANCELLED = 'pending', 'completed', 'cancelled'
+TRANSITIONS = {
+    PENDING: {COMPLETED, CANCELLED},
+    COMPLETED: set(),
+    CANCELLED: set(),
+}
+# Outcomes reported per order id
+UPDATED, NOT_FOUND, INVALID, FORBIDDEN = 'updated', 'not_found', 'invalid_transition', 'forbidden'
+FULFILLED = 'fulfilled'
+
+
+def sources(target):
+    """Statuses an order may move to ``target`` from."""
+    return sorted(status for status, targets in TRANSITIONS.items() if target in targets)
+
+
+@transaction.atomic
+def transition_orders(farmer, order_ids, target):
+    """
+    Move the orders in ``order_ids`` that ``farmer`` sells into to ``target``.
+
+    Returns ``{order_id: (outcome, status)}``: ``updated`` with the new status,
+    ``fulfilled`` with the unchanged ``pending`` status for completed parts of
+    orders still waiting on other farmers, ``invalid_transition`` with the
+    unchanged current status, ``forbidden`` with the unchanged current status
+    for cancelling orders that also hold other farmers' items, or
+    ``not_found`` (with ``None``) for orders that don't exist or aren't the
+    farmer's.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    shared = Exists(OrderItem.objects.filter(order=OuterRef('pk')).exclude(product__farmer=farmer))
+    orders = {
+        pk: (status, buyer_id, is_shared) for pk, status, buyer_id, is_shared in
+        Order.objects.select_for_update().filter(pk__in=order_ids, farmer_orders__farmer=farmer)
+        .annotate(shared=shared).order_by('pk').values_list('pk', 'status', 'buyer_id', 'shared')
+    }
+    allowed = sources(target)
+    movable = {pk: status for pk, (status, _, _) in orders.items() if status in allowed}
+    awaiting = set()
+    if target == COMPLETED and movable:
+        FarmerOrder.objects.filter(farmer=farmer, order_id__in=movable).update(fulfilled=True)
+        # A fresh read under the order locks, so parts other farmers completed meanwhile are seen
+        awaiting = set(
+            FarmerOrder.objects.filter(order_id__in=movable, fulfilled=False).values_list('order_id', flat=True)
+        )
+    changes = {
+        pk: status for pk, status in movable.items()
+        if pk not in awaiting and not (target == CANCELLED and orders[pk][2])
+    }
+    if changes:
+        # The rows are locked, so the status condition matches every one of them
+        Order.objects.filter(pk__in=changes, status__in=allowed).update(status=target)
+        items = list(OrderItem.objects.filter(order_id__in=changes).values(
+            'order_id', 'product_id', 'quantity', 'price_at_time', created_at=F('order__created_at'),
+            farmer_id=F('product__farmer_id'), category_id=F('product__category_id'),
+        ))
+        if target == CANCELLED:
+            restock = Counter()
+            for item in items:
+                restock[item['product_id']] += item['quantity']
+            # adjust() subtracts, so negate the quantities to add them back
+            Product.objects.filter(pk__in=restock).update(
+                quantity_available=adjust({pk: -quantity for pk, quantity in restock.items()}, 'quantity_available')
+            )
+            record_cancellations(items)
+        farmer_ids = record_status_changes(changes, target, items)
+        invalidate_dashboards({*farmer_ids, *(orders[pk][1] for pk in changes)})
+
+    outcomes = {}
+    for pk in order_ids:
+        if pk not in orders:
+            outcomes[pk] = (NOT_FOUND, None)
+        elif pk in changes:
+            outcomes[pk] = (UPDATED, target)
+        elif pk in awaiting:
+            outcomes[pk] = (FULFILLED, orders[pk][0])
+        elif pk in movable:
+            outcomes[pk] = (FORBIDDEN, orders[pk][0])
+        else:
+            outcomes[pk] = (INVALID, orders[pk][0])
+    return outcomes
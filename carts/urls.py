@@ -1,8 +1,11 @@
 from django.urls import path, include
-from .views import  CartView, OrderView
+from .views import  CartView, OrderTransitionView, OrderView, SalesAnalyticsView, SalesExportView
 
 urlpatterns = [
 
     path('', CartView.as_view(), name='cart'),
     path('orders/', OrderView.as_view(), name='orders'),
+    path('orders/transitions/', OrderTransitionView.as_view(), name='order_transitions'),
+    path('orders/export/', SalesExportView.as_view(), name='sales_export'),
+    path('orders/analytics/', SalesAnalyticsView.as_view(), name='sales_analytics'),
 ]
\ No newline at end of file
@@ -1,21 +1,88 @@
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
 
 from guardian.shortcuts import get_objects_for_user
+from config.eager_loading import EagerLoadingMixin
+from users.permissions import IsFarmer, is_buyer, is_farmer
 from products.models import Product
-from .models import Cart, Order, OrderItem
-from .serializers import CartSerializer, CartItemSerializer, OrderSerializer
+from products.serializers import ProductSerializer
+from .analytics import get_price_stats, get_rollups, get_series
+from .batch import apply_operations
+from .checkout import EmptyCart, checkout
+from .decorators import IDEMPOTENCY_HEADER, idempotent
+from .export import CONTENT_TYPES, ENCODERS, get_sales
+from .inventory import InsufficientStock, hold_stock, release_holds
+from .models import Cart, CartItem, Order, StockHold
+from .pagination import OrderCursorPagination
+from .serializers import (
+    CartBatchSerializer, CartDeltaSerializer, CartItemSerializer, CartSerializer, OrderSerializer,
+    OrderTransitionResultSerializer, OrderTransitionSerializer, SalesAnalyticsQuerySerializer,
+    SalesAnalyticsSerializer, SalesExportSerializer,
+)
+from .transitions import transition_orders
 
 
-class CartView(APIView):
+RESPONSE_QUERY_PARAM = 'response'
+DELTA_RESPONSE = 'delta'
+RESPONSE_PARAMETER = openapi.Parameter(
+    RESPONSE_QUERY_PARAM, openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[DELTA_RESPONSE],
+    description="'delta' returns only the changed items, removed item ids, the cart version and totals",
+)
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    IDEMPOTENCY_HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING,
+    description="Unique key per logical request; retries with the same key replay the first response",
+)
+
+
+def insufficient_stock_response(e):
+    return Response(
+        {
+            "detail": "Insufficient stock",
+            "products": [
+                {"id": product_id, "quantity_available": available}
+                for product_id, available in e.shortages.items()
+            ],
+        },
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+class CartView(EagerLoadingMixin, APIView):
     permission_classes = (IsAuthenticated,)
+    serializer_class = CartSerializer
+
+    def get_cart(self, request):
+        return self.eager_load(Cart.objects.all()).get(buyer=request.user)
 
-    @swagger_auto_schema(request_body=CartItemSerializer)
+    def cart_response(self, request, cart, items=(), removed=(), status_code=status.HTTP_200_OK):
+        """
+        Render the whole cart, or with ``?response=delta`` only the changed
+        items, the ids of removed ones, the cart version and its totals.
+        """
+        if request.query_params.get(RESPONSE_QUERY_PARAM) == DELTA_RESPONSE:
+            # The items' products were loaded before the mutation moved their stock
+            stock = {
+                pk: (available, reserved) for pk, available, reserved in
+                Product.objects.filter(pk__in={item.product_id for item in items})
+                .values_list('pk', 'quantity_available', 'quantity_reserved')
+            }
+            for item in items:
+                item.product.quantity_available, item.product.quantity_reserved = stock[item.product_id]
+            data = CartDeltaSerializer({'items': items, 'removed': removed, **cart.get_summary()}).data
+        else:
+            data = CartSerializer(self.get_cart(request)).data
+        return Response(data, status=status_code)
+
+    @swagger_auto_schema(request_body=CartItemSerializer, manual_parameters=[IDEMPOTENCY_KEY_PARAMETER, RESPONSE_PARAMETER])
+    @idempotent
     def post(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name="Buyers").exists():
+        if not is_buyer(request.user):
             return Response(
                 {"detail": "Only buyers can manage carts"},
                 status=status.HTTP_403_FORBIDDEN,
@@ -23,27 +90,70 @@ class CartView(APIView):
         cart, _ = Cart.objects.get_or_create(buyer=request.user)
         serializer = CartItemSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(cart=cart)
-            return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
+            try:
+                with transaction.atomic():
+                    quantity = serializer.validated_data.get('quantity', 1)
+                    item = CartItem.objects.add(cart, serializer.validated_data['product'], quantity)
+                    hold_stock(item, quantity)
+                    cart.bump_version()
+            except InsufficientStock as e:
+                return insufficient_stock_response(e)
+            return self.cart_response(request, cart, items=[item], status_code=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @swagger_auto_schema(request_body=CartBatchSerializer, manual_parameters=[IDEMPOTENCY_KEY_PARAMETER, RESPONSE_PARAMETER])
+    @idempotent
+    def patch(self, request, *args, **kwargs):
+        """Apply a list of add/set/remove operations and return the resulting cart."""
+        if not is_buyer(request.user):
+            return Response(
+                {"detail": "Only buyers can manage carts"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        operations = serializer.validated_data['operations']
+        product_ids = {operation['product_id'] for operation in operations}
+        products = self.eager_load(Product.objects.all(), ProductSerializer).in_bulk(product_ids)
+        missing = product_ids - products.keys()
+        if missing:
+            return Response(
+                {"detail": "Unknown products", "products": sorted(missing)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        cart, _ = Cart.objects.get_or_create(buyer=request.user)
+        try:
+            lines, removed = apply_operations(cart, operations)
+        except InsufficientStock as e:
+            return insufficient_stock_response(e)
+        for item in lines:
+            item.product = products[item.product_id]
+        return self.cart_response(request, cart, items=lines, removed=removed)
+
     def get(self, request, *args, **kwargs):
         try:
-            cart = Cart.objects.get(buyer=request.user)
+            cart = self.get_cart(request)
             return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
         except Cart.DoesNotExist:
             return Response(
                 {"detail": "Cart not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-    @swagger_auto_schema(request_body=CartItemSerializer)
+    @swagger_auto_schema(request_body=CartItemSerializer, manual_parameters=[IDEMPOTENCY_KEY_PARAMETER, RESPONSE_PARAMETER])
+    @idempotent
     def delete(self, request, *args, **kwargs):
         try:
             cart = Cart.objects.get(buyer=request.user)
             item_id = request.data.get("item_id")
             if item_id:
-                cart.items.filter(id=item_id).delete()
-                return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+                with transaction.atomic():
+                    release_holds(StockHold.objects.filter(item__cart=cart, item_id=item_id))
+                    _, deleted = cart.items.filter(id=item_id).delete()
+                    removed = [int(item_id)] if deleted.get(CartItem._meta.label) else []
+                    if removed:
+                        cart.bump_version()
+                return self.cart_response(request, cart, removed=removed)
             return Response(
                 {"detail": "Item ID required"}, status=status.HTTP_400_BAD_REQUEST
             )
@@ -53,47 +163,49 @@ class CartView(APIView):
             )
 
 
-class OrderView(APIView):
+class OrderView(EagerLoadingMixin, APIView):
     permission_classes = (IsAuthenticated,)
+    serializer_class = OrderSerializer
+    pagination_class = OrderCursorPagination
 
+    @swagger_auto_schema(manual_parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @idempotent
     def post(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name="Buyers").exists():
+        if not is_buyer(request.user):
             return Response(
                 {"detail": "Only buyers can place orders"},
                 status=status.HTTP_403_FORBIDDEN,
             )
         try:
             cart = Cart.objects.get(buyer=request.user)
-            if not cart.items.exists():
-                return Response(
-                    {"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST
-                )
-            order = Order.objects.create(buyer=request.user)
-            total_amount = 0
-            for item in cart.items.all():
-                total_amount += item.product.price * item.quantity
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price_at_time=item.product.price,
-                )
-            order.total_amount = total_amount
-            order.save()
-            cart.items.all().delete()  # Clear cart
-            return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+            order = checkout(cart)
         except Cart.DoesNotExist:
             return Response(
                 {"detail": "Cart not found"}, status=status.HTTP_404_NOT_FOUND
             )
+        except EmptyCart:
+            return Response(
+                {"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        except InsufficientStock as e:
+            return insufficient_stock_response(e)
+        order = self.eager_load(Order.objects.all()).get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Page size; enables cursor pagination", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor from a previous page's next/previous link", type=openapi.TYPE_STRING),
+    ])
     def get(self, request, *args, **kwargs):
-        if request.user.groups.filter(name="Farmers").exists():
-            orders = Order.objects.filter(
-                items__product__farmer=request.user
-            ).distinct()
+        if is_farmer(request.user):
+            orders = Order.objects.for_farmer(request.user)
         else:
-            orders = Order.objects.filter(buyer=request.user)
+            orders = Order.objects.for_buyer(request.user)
+        orders = self.eager_load(orders)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(OrderSerializer(page, many=True).data)
         return Response(
             OrderSerializer(orders, many=True).data, status=status.HTTP_200_OK
         )
@@ -114,3 +226,73 @@ class OrderView(APIView):
     #             'order_history': OrderSerializer(orders, many=True).data
     #         }
     #     return Response(data, status=status.HTTP_200_OK)
+
+
+class OrderTransitionView(APIView):
+    permission_classes = (IsAuthenticated, IsFarmer)
+
+    @swagger_auto_schema(
+        request_body=OrderTransitionSerializer,
+        manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+        responses={200: OrderTransitionResultSerializer(many=True)},
+    )
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        """Move many of the farmer's orders to a new status, reporting the outcome per id."""
+        serializer = OrderTransitionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        outcomes = transition_orders(
+            request.user, serializer.validated_data['ids'], serializer.validated_data['status']
+        )
+        results = [
+            {'id': order_id, 'outcome': outcome, 'status': order_status}
+            for order_id, (outcome, order_status) in outcomes.items()
+        ]
+        return Response(
+            {'results': OrderTransitionResultSerializer(results, many=True).data}, status=status.HTTP_200_OK
+        )
+
+
+class SalesExportView(APIView):
+    permission_classes = (IsAuthenticated, IsFarmer)
+
+    @swagger_auto_schema(query_serializer=SalesExportSerializer)
+    def get(self, request, *args, **kwargs):
+        """Stream the farmer's sold order items as CSV or JSON lines."""
+        # ?format= is taken by DRF's content negotiation
+        serializer = SalesExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        output = serializer.validated_data['output']
+        rows = get_sales(
+            request.user, serializer.validated_data.get('since'), serializer.validated_data.get('until')
+        )
+        response = StreamingHttpResponse(ENCODERS[output](rows), content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="sales.{output}"'
+        return response
+
+
+class SalesAnalyticsView(APIView):
+    # Farmers see their own sales, staff the whole platform's
+    permission_classes = (IsAuthenticated, IsFarmer | IsAdminUser)
+
+    @swagger_auto_schema(query_serializer=SalesAnalyticsQuerySerializer, responses={200: SalesAnalyticsSerializer})
+    def get(self, request, *args, **kwargs):
+        """Revenue and units per period by farmer and category, and price statistics per category."""
+        serializer = SalesAnalyticsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        period = serializer.validated_data['period']
+        rollups = get_rollups(
+            farmer=None if request.user.is_staff else request.user,
+            since=serializer.validated_data.get('since'),
+            until=serializer.validated_data.get('until'),
+        )
+        data = {
+            'period': period,
+            'by_farmer': get_series(rollups, period, 'farmer'),
+            'by_category': get_series(rollups, period, 'category'),
+            'price_stats': get_price_stats(rollups),
+        }
+        return Response(SalesAnalyticsSerializer(data).data, status=status.HTTP_200_OK)
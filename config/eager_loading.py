@@ -0,0 +1,90 @@
+"""
+Eager loading driven by serializer declarations.
+
+Serializers list the relations they read directly in ``select_related_fields``
+(forward foreign keys and one-to-ones) and ``prefetch_related_fields``. Nested
+serializer fields are followed automatically, so a view only has to know its
+top-level serializer to load everything it renders in a fixed number of
+queries.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def get_eager_relations(serializer_class, model):
+    """
+    Return ``(select_related, prefetch_related)`` lookups for rendering
+    ``model`` instances with ``serializer_class``.
+    """
+    select = list(getattr(serializer_class, 'select_related_fields', ()))
+    prefetch = list(getattr(serializer_class, 'prefetch_related_fields', ()))
+
+    for name, field in serializer_class._declared_fields.items():
+        if field.write_only:
+            continue
+        many = isinstance(field, serializers.ListSerializer)
+        nested = field.child if many else field
+        if not isinstance(nested, serializers.ModelSerializer):
+            continue
+        source = field.source or name
+        if source == '*' or '.' in source:
+            continue
+        try:
+            related_model = model._meta.get_field(source).related_model
+        except FieldDoesNotExist:
+            continue
+        if related_model is None:
+            continue
+
+        if related_model is not nested.Meta.model:
+            # The nested serializer renders another model; load the
+            # relation itself and leave the rest alone.
+            (prefetch if many else select).append(source)
+        elif many:
+            queryset = eager_load(related_model._default_manager.all(), type(nested))
+            prefetch.append(Prefetch(source, queryset=queryset))
+        else:
+            nested_select, nested_prefetch = get_eager_relations(type(nested), related_model)
+            select.append(source)
+            select.extend(f'{source}__{lookup}' for lookup in nested_select)
+            prefetch.extend(_prefix_prefetch(source, lookup) for lookup in nested_prefetch)
+
+    return select, prefetch
+
+
+def _prefix_prefetch(prefix, lookup):
+    if isinstance(lookup, Prefetch):
+        return Prefetch(f'{prefix}__{lookup.prefetch_through}', queryset=lookup.queryset)
+    return f'{prefix}__{lookup}'
+
+
+def eager_load(queryset, serializer_class):
+    """Apply the relations ``serializer_class`` traverses to ``queryset``."""
+    select, prefetch = get_eager_relations(serializer_class, queryset.model)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class EagerLoadingMixin:
+    """
+    View mixin that eager loads querysets for the view's serializer.
+
+    Generic views get it through ``get_queryset()``. Views that build their
+    own querysets (plain APIViews, or overridden ``get_queryset``) call
+    ``self.eager_load()`` with the serializer they render.
+    """
+
+    def get_queryset(self):
+        return self.eager_load(super().get_queryset())
+
+    def get_serializer_class(self):
+        return self.serializer_class
+
+    def eager_load(self, queryset, serializer_class=None):
+        if serializer_class is None:
+            serializer_class = self.get_serializer_class()
+        return eager_load(queryset, serializer_class)
@@ -45,6 +45,8 @@ CUSTOM_APPS = [
     "users", 
     "products",
     "carts",
+    "jobs",
+    "notifications",
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + CUSTOM_APPS
@@ -65,6 +67,9 @@ AUTHENTICATION_BACKENDS = (
     'guardian.backends.ObjectPermissionBackend',  # For object-level permissions
 )
 
+# Seconds to share object permission lookups across requests (0 disables)
+OBJECT_PERMISSION_CACHE_TTL = config('OBJECT_PERMISSION_CACHE_TTL', cast=int, default=0)
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -126,6 +131,28 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# Policy for new passwords, 'pbkdf2' or 'scrypt'. Hashes made under the other policy or with
+# other cost settings are rehashed on the user's next login, see users.hashers.
+PASSWORD_HASHER_POLICY = config('PASSWORD_HASHER_POLICY', default='pbkdf2')
+PASSWORD_HASHER_POLICIES = {
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_POLICIES[PASSWORD_HASHER_POLICY],
+    *(hasher for policy, hasher in PASSWORD_HASHER_POLICIES.items() if policy != PASSWORD_HASHER_POLICY),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+# Cost parameters; tune them per environment with the benchmark_logins command
+PASSWORD_PBKDF2_ITERATIONS = config('PASSWORD_PBKDF2_ITERATIONS', cast=int, default=1_000_000)
+PASSWORD_SCRYPT_WORK_FACTOR = config('PASSWORD_SCRYPT_WORK_FACTOR', cast=int, default=2**14)
+PASSWORD_SCRYPT_BLOCK_SIZE = config('PASSWORD_SCRYPT_BLOCK_SIZE', cast=int, default=8)
+PASSWORD_SCRYPT_PARALLELISM = config('PASSWORD_SCRYPT_PARALLELISM', cast=int, default=1)
+# Rows with a password one provisioning request may carry; each is hashed inline at the cost above.
+# Larger rosters with passwords go through the provision_users command.
+PROVISION_MAX_PASSWORDS = config('PROVISION_MAX_PASSWORDS', cast=int, default=20)
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 LANGUAGE_CODE = 'en-us'
@@ -160,6 +187,7 @@ EMAIL_PORT = config('EMAIL_PORT', cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool, default=True)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
 logger.info(f"EMAIL_HOST: {EMAIL_HOST}")
 
 # CORS Configuration
@@ -173,7 +201,7 @@ logger.info(f"CORS_ALLOWED_ORIGINS: {CORS_ALLOWED_ORIGINS}")
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.RoleTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -190,7 +218,45 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.FilteredTokenRefreshSerializer',
 }
+# Expected blacklisted refresh tokens per process Bloom filter, see users.blacklist (0 disables).
+# Only enable with a cache shared by all processes.
+TOKEN_BLACKLIST_FILTER_CAPACITY = config('TOKEN_BLACKLIST_FILTER_CAPACITY', cast=int, default=0)
+TOKEN_BLACKLIST_FILTER_ERROR_RATE = config('TOKEN_BLACKLIST_FILTER_ERROR_RATE', cast=float, default=0.001)
+
+# Carts
+# Seconds a cart item holds its stock before other buyers can take it
+STOCK_HOLD_TTL = config('STOCK_HOLD_TTL', cast=int, default=900)
+# Seconds an Idempotency-Key is kept before purge_idempotency_keys deletes it
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', cast=int, default=86400)
+
+# Products
+# Products with this many units or fewer count as low stock on the farmer dashboard
+LOW_STOCK_THRESHOLD = config('LOW_STOCK_THRESHOLD', cast=int, default=10)
+# Seconds to cache each user's dashboard payload, see products.dashboard (0 disables).
+# Only enable with a cache shared by all processes.
+DASHBOARD_CACHE_TTL = config('DASHBOARD_CACHE_TTL', cast=int, default=0)
+
+# Jobs
+# Worker threads per run_jobs process, and jobs claimed per query
+JOB_CONCURRENCY = config('JOB_CONCURRENCY', cast=int, default=1)
+JOB_BATCH_SIZE = config('JOB_BATCH_SIZE', cast=int, default=10)
+# Seconds run_jobs sleeps when no job is due
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', cast=float, default=1.0)
+# Attempts before a job is marked failed; retries wait JOB_RETRY_BACKOFF seconds, doubling up to JOB_RETRY_MAX_DELAY
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', cast=int, default=5)
+JOB_RETRY_BACKOFF = config('JOB_RETRY_BACKOFF', cast=int, default=30)
+JOB_RETRY_MAX_DELAY = config('JOB_RETRY_MAX_DELAY', cast=int, default=3600)
+# Seconds a job may stay running before another worker assumes its worker died and retries it
+JOB_LOCK_TIMEOUT = config('JOB_LOCK_TIMEOUT', cast=int, default=300)
+
+# Notifications
+# Seconds a user's oldest pending notification waits before their digest is emailed
+NOTIFICATION_DIGEST_WINDOW = config('NOTIFICATION_DIGEST_WINDOW', cast=int, default=900)
+# Recipients whose digests are sent over one SMTP connection
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', cast=int, default=100)
 
 # Swagger Configuration (drf_yasg)
 SWAGGER_SETTINGS = {
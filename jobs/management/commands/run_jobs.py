@@ -0,0 +1,54 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from jobs.queue import claim, run
+
+
+def run_in_thread(job):
+    # Each pool thread has its own connection; drop it if it has gone stale
+    close_old_connections()
+    try:
+        return run(job)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs, polling for new ones until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOB_CONCURRENCY, help='Jobs to run at once')
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_BATCH_SIZE, help='Jobs to claim per query')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no jobs are due')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--concurrency and --batch-size must be at least 1")
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        pool = ThreadPoolExecutor(options['concurrency']) if options['concurrency'] > 1 else None
+        done = failed = 0
+        try:
+            while True:
+                jobs = claim(worker, options['batch_size'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                results = pool.map(run_in_thread, jobs) if pool else map(run, jobs)
+                for succeeded in results:
+                    done += succeeded
+                    failed += not succeeded
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Ran {done + failed} jobs, {failed} raised errors."))
@@ -0,0 +1,118 @@
+"""
+A small database-backed job queue.
+
+Handlers are plain functions registered under a name with ``@task``.
+``enqueue`` writes the jobs inside the caller's transaction, so they commit
+or roll back together with the work that produced them, and a worker can't
+see them before that commit. The ``run_jobs`` command claims due jobs with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent workers never take the
+same job. On databases without it (SQLite), a conditional UPDATE per job
+claims it instead. Failed jobs are retried with exponential backoff, up to
+``JOB_MAX_ATTEMPTS`` attempts. An attempt is counted when the job is claimed,
+so a job whose worker dies or hangs on it also runs out of attempts instead
+of being reclaimed forever.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+def task(name):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue_many(jobs, delay=0):
+    """Queue ``(name, payload)`` pairs in one insert, due in ``delay`` seconds."""
+    run_at = timezone.now() + timedelta(seconds=delay)
+    rows = []
+    for name, payload in jobs:
+        if name not in TASKS:
+            raise UnknownTask(name)
+        rows.append(Job(name=name, payload=payload, run_at=run_at, max_attempts=settings.JOB_MAX_ATTEMPTS))
+    return Job.objects.bulk_create(rows)
+
+
+def enqueue(name, delay=0, **payload):
+    """Queue a call of the task ``name`` with ``payload``, due in ``delay`` seconds."""
+    return enqueue_many([(name, payload)], delay=delay)[0]
+
+
+def get_backoff(attempts):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times."""
+    return min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+
+
+def claim(worker, limit):
+    """
+    Mark up to ``limit`` due jobs as running for ``worker``, counting an
+    attempt for each, and return them. Jobs left running longer than
+    ``JOB_LOCK_TIMEOUT`` (their worker died) are due again, or failed if that
+    was their last attempt.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    claimed = {'status': Job.RUNNING, 'locked_at': now, 'locked_by': worker, 'attempts': F('attempts') + 1}
+    due = Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_at__lt=stale)
+    ).order_by('run_at', 'pk')
+    with transaction.atomic():
+        Job.objects.filter(status=Job.RUNNING, locked_at__lt=stale, attempts__gte=F('max_attempts')).update(
+            status=Job.FAILED, finished_at=now, locked_at=None, locked_by='',
+            last_error=f"Worker stalled for over {settings.JOB_LOCK_TIMEOUT}s on the last attempt",
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claimed)
+        else:
+            ids = []
+            for job in due.values('pk', 'status', 'locked_at')[:limit]:
+                # Only succeeds if no other worker claimed the job since it was read
+                if Job.objects.filter(**job).update(**claimed):
+                    ids.append(job['pk'])
+    return list(Job.objects.filter(pk__in=ids).order_by('run_at', 'pk'))
+
+
+def run(job):
+    """Run a claimed ``job`` and record the outcome. Returns True if it succeeded."""
+    # claim() already counted this attempt
+    attempts = job.attempts
+    try:
+        if job.name not in TASKS:
+            raise UnknownTask(job.name)
+        TASKS[job.name](**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if attempts >= job.max_attempts:
+            logger.error("Job %s (%s) failed after %s attempts:\n%s", job.pk, job.name, attempts, error)
+            changes = {'status': Job.FAILED, 'finished_at': timezone.now()}
+        else:
+            logger.warning("Job %s (%s) failed, retrying:\n%s", job.pk, job.name, error)
+            changes = {'status': Job.QUEUED, 'run_at': timezone.now() + timedelta(seconds=get_backoff(attempts))}
+        finished = False
+    else:
+        changes = {'status': Job.DONE, 'finished_at': timezone.now()}
+        error, finished = '', True
+    # Only if the job is still ours; it may have been reclaimed after a stall
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(
+        locked_at=None, locked_by='', last_error=error, **changes
+    )
+    return finished
@@ -0,0 +1,103 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import TASKS, UnknownTask, claim, enqueue, enqueue_many, get_backoff, run
+
+calls = []
+
+
+def record(**payload):
+    calls.append(payload)
+
+
+def explode(**payload):
+    raise RuntimeError("boom")
+
+
+@override_settings(JOB_MAX_ATTEMPTS=3, JOB_RETRY_BACKOFF=10, JOB_RETRY_MAX_DELAY=25, JOB_LOCK_TIMEOUT=60)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        patcher = mock.patch.dict(TASKS, {'test.record': record, 'test.explode': explode})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_jobs(self, *args):
+        out = StringIO()
+        call_command('run_jobs', '--once', *args, stdout=out)
+        return out.getvalue()
+
+    def test_enqueue_and_run(self):
+        """Test that queued jobs run once, in order, with their payload."""
+        enqueue_many([('test.record', {'n': 1}), ('test.record', {'n': 2})])
+        enqueue('test.record', delay=60, n=3)
+        self.assertIn("Ran 2 jobs, 0 raised errors.", self.run_jobs())
+        self.assertEqual(calls, [{'n': 1}, {'n': 2}])
+        self.assertEqual(Job.objects.filter(status=Job.DONE, attempts=1).count(), 2)
+        self.assertIn("Ran 0 jobs", self.run_jobs())
+        self.assertEqual(Job.objects.get(status=Job.QUEUED).payload, {'n': 3})
+
+    def test_enqueue_unknown_task(self):
+        """Test that enqueueing an unregistered task fails immediately."""
+        with self.assertRaises(UnknownTask):
+            enqueue('test.missing')
+        self.assertFalse(Job.objects.exists())
+
+    def test_retries_with_backoff(self):
+        """Test that failing jobs are retried with growing delays, then marked failed."""
+        self.assertEqual([get_backoff(attempts) for attempts in (1, 2, 3)], [10, 20, 25])
+        job = enqueue('test.explode')
+        for attempts in (1, 2):
+            before = timezone.now()
+            with self.assertLogs('jobs.queue', 'WARNING'):
+                self.assertIn("1 raised errors", self.run_jobs())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, attempts))
+            self.assertIn("RuntimeError: boom", job.last_error)
+            self.assertGreaterEqual(job.run_at, before + timedelta(seconds=get_backoff(attempts)))
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claim_skips_claimed_jobs(self):
+        """Test that a job claimed by one worker is not claimed again until its lock goes stale."""
+        job = enqueue('test.record')
+        self.assertEqual(claim('worker-1', 10), [job])
+        self.assertEqual(claim('worker-2', 10), [])
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=61))
+        reclaimed = claim('worker-2', 10)
+        self.assertEqual([(j.pk, j.locked_by) for j in reclaimed], [(job.pk, 'worker-2')])
+        # The first worker finishing late doesn't overwrite the new claim
+        job.locked_by = 'worker-1'
+        run(job)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+
+    def test_stalled_job_runs_out_of_attempts(self):
+        """Test that a job whose worker keeps stalling is marked failed after its last attempt."""
+        job = enqueue('test.record')
+        for attempts in (1, 2, 3):
+            self.assertEqual([(j.pk, j.attempts) for j in claim(f'worker-{attempts}', 10)], [(job.pk, attempts)])
+            Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(claim('worker-4', 10), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.FAILED, 3, ''))
+        self.assertIn('stalled', job.last_error)
+        self.assertEqual(calls, [])
+
+    def test_claim_without_skip_locked(self):
+        """Test the conditional UPDATE claim used on databases without SKIP LOCKED."""
+        enqueue_many([('test.record', {'n': n}) for n in range(3)])
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False):
+            jobs = claim('worker-1', 2)
+        self.assertEqual([job.payload['n'] for job in jobs], [0, 1])
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING, locked_by='worker-1').count(), 2)
@@ -0,0 +1,92 @@
+"""
+Email digests.
+
+Events are stored as Notification rows with ``notify`` instead of being mailed
+one by one. ``send_digests`` (run periodically by the
+``send_notification_digests`` command) mails each recipient everything
+pending once their oldest notification is ``NOTIFICATION_DIGEST_WINDOW``
+seconds old. A busy farmer therefore gets one email per window rather than
+one per order. Each batch of recipients is sent over a single connection,
+one digest at a time. A digest that fails to send is logged and left pending
+for the next run, while the rest of the run carries on, so one refused
+address can't hold up everyone else's digests.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+def notify(messages):
+    """Queue ``(recipient_id, message)`` pairs for the recipients' next digests, in one insert."""
+    return Notification.objects.bulk_create([
+        Notification(recipient_id=recipient_id, message=message) for recipient_id, message in messages
+    ])
+
+
+def get_due_recipients(now):
+    """Ids of users with pending notifications at least one digest window old."""
+    cutoff = now - timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW)
+    return list(
+        Notification.objects.filter(sent_at__isnull=True).values('recipient')
+        .annotate(oldest=Min('created_at')).filter(oldest__lte=cutoff)
+        .order_by('recipient').values_list('recipient', flat=True)
+    )
+
+
+def build_digest(recipient, notifications):
+    count = len(notifications)
+    lines = '\n\n'.join(notification.message for notification in notifications)
+    return EmailMessage(
+        f"FarmDirect: {count} update{'s' if count != 1 else ''}",
+        f"Hi {recipient.username},\n\n{lines}\n",
+        to=[recipient.email],
+    )
+
+
+def send_batch(recipient_ids, now, connection):
+    """Send the digests of ``recipient_ids``. Returns the number of emails sent."""
+    pending = list(
+        Notification.objects.filter(recipient__in=recipient_ids, sent_at__isnull=True)
+        .select_related('recipient').order_by('recipient', 'created_at', 'pk')
+    )
+    # Claim the rows first, so a concurrent run can't mail them again
+    ids = [notification.pk for notification in pending]
+    if Notification.objects.filter(pk__in=ids, sent_at__isnull=True).update(sent_at=now) != len(ids):
+        # Another run got some of them; leave this batch to it
+        Notification.objects.filter(pk__in=ids, sent_at=now).update(sent_at=None)
+        return 0
+    grouped = defaultdict(list)
+    for notification in pending:
+        grouped[notification.recipient].append(notification)
+    sent = 0
+    for recipient, items in grouped.items():
+        # Recipients without an address are marked sent all the same, so their rows don't pile up
+        if not recipient.email:
+            continue
+        try:
+            sent += connection.send_messages([build_digest(recipient, items)]) or 0
+        except Exception:
+            logger.exception("Digest for user %s failed to send, retrying next run", recipient.pk)
+            Notification.objects.filter(pk__in=[notification.pk for notification in items]).update(sent_at=None)
+    return sent
+
+
+def send_digests(batch_size=None):
+    """Send every due digest, ``batch_size`` recipients per connection. Returns the number of emails sent."""
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    now = timezone.now()
+    recipients = get_due_recipients(now)
+    sent = 0
+    for start in range(0, len(recipients), batch_size):
+        with get_connection() as connection:
+            sent += send_batch(recipients[start:start + batch_size], now, connection)
+    return sent
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.digest import send_digests
+
+
+class Command(BaseCommand):
+    help = "Emails notification digests to users whose digest window has passed (run periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.NOTIFICATION_BATCH_SIZE, help='Recipients to send per SMTP connection'
+        )
+
+    def handle(self, *args, **options):
+        sent = send_digests(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} notification digests."))
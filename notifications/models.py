@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+class Notification(models.Model):
+    """
+    One line of a user's next email digest. Written by ``notifications.digest.notify``
+    and marked sent by ``send_digests``.
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        indexes = [
+            # Pending notifications per recipient, oldest first
+            models.Index(fields=['sent_at', 'recipient', 'created_at'], name='notification_pending_idx'),
+        ]
+    def __str__(self):
+        return f"Notification {self.pk} for user {self.recipient_id}"
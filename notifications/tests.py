@@ -0,0 +1,81 @@
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .digest import notify, send_digests
+from .models import Notification
+
+
+@override_settings(NOTIFICATION_DIGEST_WINDOW=600, NOTIFICATION_BATCH_SIZE=2)
+class DigestTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='password123')
+            for i in range(3)
+        ]
+
+    def age(self, seconds):
+        Notification.objects.update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_digest_per_recipient(self):
+        """Test that pending notifications are mailed as one digest per user once the window passes."""
+        notify([(self.users[0].pk, 'First'), (self.users[0].pk, 'Second'), (self.users[1].pk, 'Third')])
+        self.assertEqual(send_digests(), 0)
+        self.age(601)
+        self.assertEqual(send_digests(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [['user0@example.com'], ['user1@example.com']])
+        self.assertEqual(mail.outbox[0].subject, 'FarmDirect: 2 updates')
+        self.assertIn('First\n\nSecond', mail.outbox[0].body)
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(send_digests(), 0)
+
+    def test_one_connection_per_batch(self):
+        """Test that each batch of recipients shares one connection."""
+        notify([(user.pk, 'Update') for user in self.users])
+        self.age(601)
+        with mock.patch('notifications.digest.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(send_digests(), 3)
+        self.assertEqual(get_connection.call_count, 2)
+
+    def test_failed_send_is_retried(self):
+        """Test that a digest that fails to send stays pending for the next run."""
+        notify([(self.users[0].pk, 'Update')])
+        self.age(601)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            with self.assertLogs('notifications.digest', 'ERROR'):
+                self.assertEqual(send_digests(), 0)
+        self.assertTrue(Notification.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(send_digests(), 1)
+
+    def test_refused_recipient_does_not_block_others(self):
+        """Test that a permanently refused address neither stops later digests nor resends earlier ones."""
+        notify([(user.pk, 'Update') for user in self.users])
+        self.age(601)
+        send_messages = mail.backends.locmem.EmailBackend.send_messages
+        def refuse_user1(backend, messages):
+            if messages[0].to == ['user1@example.com']:
+                raise SMTPRecipientsRefused({'user1@example.com': (550, b'No such user')})
+            return send_messages(backend, messages)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', refuse_user1):
+            for _ in range(2):
+                with self.assertLogs('notifications.digest', 'ERROR'):
+                    send_digests()
+        self.assertEqual([message.to for message in mail.outbox], [['user0@example.com'], ['user2@example.com']])
+        self.assertEqual(
+            list(Notification.objects.filter(sent_at__isnull=True).values_list('recipient', flat=True)),
+            [self.users[1].pk],
+        )
+
+    def test_recipient_without_email(self):
+        """Test that notifications for users without an address are dropped, not mailed."""
+        User.objects.filter(pk=self.users[0].pk).update(email='')
+        notify([(self.users[0].pk, 'Update')])
+        self.age(601)
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
@@ -0,0 +1,98 @@
+"""
+Per-user dashboard cache.
+
+With ``DASHBOARD_CACHE_TTL`` set, each user's dashboard payload is cached
+under a key that embeds the user's dashboard version. Signals bump the
+version of every farmer or buyer a write affects (see products.signals), once
+the write commits. Stale payloads are then never read again and expire on
+their own. This relies on a cache shared by every process: with the
+per-process local-memory cache (the default, as no ``CACHES`` are set) a
+version bump only reaches the process that made the write, and the others
+serve stale dashboards until the TTL runs out. Keep the cache off (the
+default) unless a shared backend is configured.
+
+On a miss, only the request that wins a short ``cache.add`` lock recomputes the
+payload. Requests arriving meanwhile poll for its result instead of all
+hitting the database at once. If the result doesn't show up within the lock
+timeout, they compute it themselves. Hits, misses and waits are counted in the
+cache for scraping, see ``get_stats``.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'dashboard:version:{}'
+PAYLOAD_KEY = 'dashboard:{}:{}'
+LOCK_KEY = 'dashboard:lock:{}:{}'
+STATS_KEY = 'dashboard:stats:{}'
+STATS = ('hits', 'misses', 'waits')
+# Seconds a recompute may hold the lock, and between polls for its result
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+
+def invalidate_dashboards(user_ids):
+    """Drop the cached dashboards of ``user_ids`` once the current transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: cache.set_many(
+            {VERSION_KEY.format(user_id): uuid.uuid4().hex for user_id in user_ids}, None
+        ))
+
+
+def count(name):
+    key = STATS_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First count since the cache was cleared
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    """Return ``{'hits': n, 'misses': n, 'waits': n}``; waits are misses served by another recompute."""
+    counts = cache.get_many([STATS_KEY.format(name) for name in STATS])
+    return {name: counts.get(STATS_KEY.format(name), 0) for name in STATS}
+
+
+def wait_for(key):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+    return None
+
+
+def get_dashboard(user_id, compute):
+    """Return ``user_id``'s cached dashboard, calling ``compute()`` to build it on a miss."""
+    ttl = settings.DASHBOARD_CACHE_TTL
+    if not ttl:
+        return compute()
+    version = cache.get(VERSION_KEY.format(user_id), '0')
+    key = PAYLOAD_KEY.format(user_id, version)
+    payload = cache.get(key)
+    if payload is not None:
+        count('hits')
+        return payload
+    count('misses')
+
+    lock = LOCK_KEY.format(user_id, version)
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    if not locked:
+        payload = wait_for(key)
+        if payload is not None:
+            count('waits')
+            return payload
+    try:
+        payload = compute()
+        cache.set(key, payload, ttl)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return payload
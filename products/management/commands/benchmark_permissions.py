@@ -0,0 +1,94 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import get_objects_for_user
+
+from products.models import Category, Product, ProductGroupObjectPermission, ProductUserObjectPermission
+
+BATCH_SIZE = 5000
+
+
+@contextmanager
+def direct_permissions(enabled):
+    """Let guardian use (or ignore) the direct-FK Product permission tables."""
+    models = (ProductUserObjectPermission, ProductGroupObjectPermission)
+    try:
+        for model in models:
+            model.enabled = enabled
+        yield
+    finally:
+        for model in models:
+            model.enabled = True
+
+
+class Command(BaseCommand):
+    help = "Compares product list latency with guardian's generic and direct-FK permission tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help="Number of products to seed")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per mode")
+        parser.add_argument('--page-size', type=int, default=20, help="Rows rendered per list call")
+
+    def handle(self, *args, **kwargs):
+        # Everything is seeded inside a transaction that is rolled back at the end.
+        with transaction.atomic():
+            buyer = self.seed(kwargs['products'])
+            for label, enabled in (('generic', False), ('direct', True)):
+                with direct_permissions(enabled):
+                    timing = self.time(lambda: self.run(buyer, kwargs['page_size']), kwargs['repeat'])
+                self.stdout.write(f"{label:8} {timing:8.2f} ms")
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark completed, seeded rows rolled back."))
+
+    def seed(self, count):
+        farmer = User.objects.create_user(username='benchmark_farmer', password=None)
+        buyer = User.objects.create_user(username='benchmark_buyer', password=None)
+        category, _ = Category.objects.get_or_create(name='Benchmark')
+        content_type = ContentType.objects.get_for_model(Product)
+        permission = Permission.objects.get(content_type=content_type, codename='view_product')
+
+        for start in range(0, count, BATCH_SIZE):
+            products = Product.objects.bulk_create([
+                Product(
+                    name=f"Product {i}", price=1 + i % 100, category=category, quantity_available=10,
+                    harvest_date='2025-08-01', expiry_date='2025-12-01', farmer=farmer,
+                )
+                for i in range(start, min(start + BATCH_SIZE, count))
+            ])
+            # The buyer can see every product through both tables
+            UserObjectPermission.objects.bulk_create([
+                UserObjectPermission(
+                    user=buyer, permission=permission, content_type=content_type, object_pk=str(product.pk)
+                )
+                for product in products
+            ])
+            ProductUserObjectPermission.objects.bulk_create([
+                ProductUserObjectPermission(user=buyer, permission=permission, content_object=product)
+                for product in products
+            ])
+        self.stdout.write(f"Seeded {count} products")
+        return buyer
+
+    def run(self, user, page_size):
+        # What the product list does: filter by view permission, order, render a page
+        queryset = get_objects_for_user(
+            user, 'products.view_product', Product, accept_global_perms=False
+        ).order_by('created_at', 'id')
+        queryset.count()
+        list(queryset[:page_size])
+
+    def time(self, func, repeat):
+        func()  # warm up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
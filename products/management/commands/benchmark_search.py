@@ -0,0 +1,85 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product, Category
+from products.search import get_search_backend
+
+ADJECTIVES = ['fresh', 'organic', 'ripe', 'sweet', 'green', 'red', 'local', 'dried', 'wild', 'young']
+PRODUCE = ['carrots', 'apples', 'tomatoes', 'maize', 'cassava', 'yams', 'plantain', 'okra', 'peppers', 'onions',
+           'mangoes', 'pineapples', 'groundnuts', 'beans', 'millet', 'sorghum', 'cabbage', 'garden eggs']
+DEFAULT_QUERIES = ['carrots', 'organic okra', 'pine', 'sorghum harvest', 'nothingmatches']
+
+
+class Command(BaseCommand):
+    help = "Compares full-text product search with the old name__icontains filter on a seeded catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000, help="Number of products to seed")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query")
+        parser.add_argument('--query', action='append', dest='queries', help="Query to time (repeatable)")
+
+    def handle(self, *args, **kwargs):
+        backend = get_search_backend()
+        queries = kwargs['queries'] or DEFAULT_QUERIES
+        self.stdout.write(f"Backend: {type(backend).__name__}")
+
+        # Everything is seeded inside a transaction that is rolled back at the end.
+        with transaction.atomic():
+            self.seed(kwargs['products'])
+            backend.rebuild()
+            products = Product.objects.all()
+            for query in queries:
+                icontains = self.time(lambda: self.run(
+                    products.filter(name__icontains=query).order_by('id')
+                ), kwargs['repeat'])
+                search = self.time(lambda: self.run(
+                    backend.search(products, query).order_by('-search_rank', '-id')
+                ), kwargs['repeat'])
+                self.stdout.write(
+                    f"{query!r:24} icontains {icontains:8.2f} ms   full-text {search:8.2f} ms"
+                )
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark completed, seeded rows rolled back."))
+
+    def seed(self, count):
+        rng = random.Random(0)
+        farmer = User.objects.create_user(username='benchmark_farmer', password=None)
+        category, _ = Category.objects.get_or_create(name='Benchmark')
+        batch = []
+        for i in range(count):
+            name = f"{rng.choice(ADJECTIVES)} {rng.choice(PRODUCE)}"
+            batch.append(Product(
+                name=name.title(),
+                description=f"{rng.choice(ADJECTIVES)} {name} from a {rng.choice(ADJECTIVES)} harvest, lot {i}",
+                price=rng.randint(100, 10000) / 100,
+                category=category,
+                quantity_available=rng.randint(0, 500),
+                harvest_date='2025-08-01',
+                expiry_date='2025-12-01',
+                farmer=farmer,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {count} products")
+
+    def run(self, queryset):
+        # What the list endpoint does: count matches and render the first page
+        queryset.count()
+        list(queryset[:20])
+
+    def time(self, func, repeat):
+        func()  # warm up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from products.models import FarmerSummary, Product
+from products.summary import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuilds farmer dashboard summaries from orders and products (run nightly, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Farmers to rebuild per transaction')
+
+    def handle(self, *args, **options):
+        farmer_ids = sorted(
+            set(Product.objects.values_list('farmer_id', flat=True).distinct())
+            | set(FarmerSummary.objects.values_list('farmer_id', flat=True))
+        )
+        batch_size = options['batch_size']
+        corrected = 0
+        for start in range(0, len(farmer_ids), batch_size):
+            # Each batch locks only its own farmers' products, and only briefly
+            corrected += rebuild(farmer_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {len(farmer_ids)} farmer summaries, {corrected} corrected."
+        ))
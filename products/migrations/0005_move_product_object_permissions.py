@@ -0,0 +1,79 @@
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+# (generic guardian model, direct product model, owner column)
+PERMISSION_MODELS = (
+    ('UserObjectPermission', 'ProductUserObjectPermission', 'user_id'),
+    ('GroupObjectPermission', 'ProductGroupObjectPermission', 'group_id'),
+)
+
+
+def get_product_content_type(apps):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    return ContentType.objects.filter(app_label='products', model='product').first()
+
+
+def move_to_direct(apps, schema_editor):
+    """Copy generic Product permission rows into the direct tables."""
+    content_type = get_product_content_type(apps)
+    if content_type is None:
+        return
+    Product = apps.get_model('products', 'Product')
+    for generic_name, direct_name, owner in PERMISSION_MODELS:
+        Generic = apps.get_model('guardian', generic_name)
+        Direct = apps.get_model('products', direct_name)
+        rows = Generic.objects.filter(content_type=content_type)
+        batch = []
+        for row in rows.values(owner, 'permission_id', 'object_pk').iterator(chunk_size=BATCH_SIZE):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                copy_batch(Product, Direct, owner, batch)
+                batch = []
+        copy_batch(Product, Direct, owner, batch)
+        rows.delete()
+
+
+def copy_batch(Product, Direct, owner, batch):
+    # object_pk is free text; skip rows pointing at deleted products
+    existing = set(Product.objects.filter(
+        pk__in=[int(row['object_pk']) for row in batch if row['object_pk'].isdigit()]
+    ).values_list('pk', flat=True))
+    Direct.objects.bulk_create([
+        Direct(**{owner: row[owner]}, permission_id=row['permission_id'], content_object_id=int(row['object_pk']))
+        for row in batch if row['object_pk'].isdigit() and int(row['object_pk']) in existing
+    ], ignore_conflicts=True)
+
+
+def move_to_generic(apps, schema_editor):
+    """Copy direct Product permission rows back into the generic tables."""
+    content_type = get_product_content_type(apps)
+    if content_type is None:
+        return
+    for generic_name, direct_name, owner in PERMISSION_MODELS:
+        Generic = apps.get_model('guardian', generic_name)
+        Direct = apps.get_model('products', direct_name)
+        batch = []
+        for row in Direct.objects.values(owner, 'permission_id', 'content_object_id').iterator(chunk_size=BATCH_SIZE):
+            batch.append(Generic(
+                **{owner: row[owner]}, permission_id=row['permission_id'],
+                content_type=content_type, object_pk=str(row['content_object_id'])
+            ))
+            if len(batch) == BATCH_SIZE:
+                Generic.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Generic.objects.bulk_create(batch, ignore_conflicts=True)
+        Direct.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('guardian', '0002_generic_permissions_index'),
+        ('products', '0004_product_object_permissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_to_direct, move_to_generic),
+    ]
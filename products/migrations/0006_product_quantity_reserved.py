@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_move_product_object_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='quantity_reserved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
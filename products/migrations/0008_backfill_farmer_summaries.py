@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_farmer_summaries(apps, schema_editor):
+    """Fill units_sold and one summary row per farmer from existing orders and products."""
+    Product = apps.get_model('products', 'Product')
+    FarmerSummary = apps.get_model('products', 'FarmerSummary')
+    OrderItem = apps.get_model('carts', 'OrderItem')
+    sales = OrderItem.objects.exclude(order__status='cancelled')
+
+    sold = sales.filter(product=OuterRef('pk')).values('product').annotate(total=Sum('quantity')).values('total')
+    Product.objects.update(units_sold=Coalesce(Subquery(sold), 0))
+
+    summaries = {}
+    for row in Product.objects.values('farmer_id').annotate(
+        product_count=Count('pk'),
+        low_stock_count=Count('pk', filter=Q(quantity_available__lte=settings.LOW_STOCK_THRESHOLD)),
+    ):
+        summaries[row.pop('farmer_id')] = row
+    for row in sales.values('product__farmer_id').annotate(
+        revenue=Sum(F('price_at_time') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        units_sold=Sum('quantity'),
+        order_count=Count('order', distinct=True),
+        pending_order_count=Count('order', distinct=True, filter=Q(order__status='pending')),
+    ):
+        summaries[row.pop('product__farmer_id')].update(row)
+    FarmerSummary.objects.bulk_create(
+        [FarmerSummary(farmer_id=farmer_id, **counters) for farmer_id, counters in summaries.items()],
+        batch_size=1000,
+    )
+
+
+def clear_farmer_summaries(apps, schema_editor):
+    apps.get_model('products', 'FarmerSummary').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_farmer_summary'),
+        ('carts', '0009_backfill_farmer_orders'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_farmer_summaries, clear_farmer_summaries),
+    ]
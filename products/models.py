@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
+from guardian.models import GroupObjectPermissionBase, UserObjectPermissionBase
 
 
 User = get_user_model()
@@ -16,10 +17,75 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     quantity_available = models.PositiveIntegerField(default=0)
+    # Units held by carts (carts.StockHold), kept in step by carts.inventory
+    quantity_reserved = models.PositiveIntegerField(default=0)
+    # Units sold in orders that weren't cancelled, see products.summary
+    units_sold = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     harvest_date = models.DateField()
     expiry_date = models.DateField()
     farmer = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination keys, see products.pagination
+            models.Index(fields=['created_at', 'id'], name='product_created_at_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            # A farmer's best sellers on the dashboard
+            models.Index(fields=['farmer', 'units_sold', 'id'], name='product_farmer_units_sold_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    @property
+    def available_quantity(self):
+        return max(self.quantity_available - self.quantity_reserved, 0)
+
+
+class FarmerSummary(models.Model):
+    """
+    A farmer's sales and stock counters for the dashboard, maintained by
+    products.summary instead of being aggregated per request.
+    """
+    farmer = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='farmer_summary')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    pending_order_count = models.PositiveIntegerField(default=0)
+    product_count = models.PositiveIntegerField(default=0)
+    low_stock_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Summary for farmer {self.farmer_id}"
+
+
+# Direct foreign-key object permissions: guardian picks these up for Product
+# instead of the generic text object_pk + content type tables.
+class ProductUserObjectPermission(UserObjectPermissionBase):
+    content_object = models.ForeignKey(Product, on_delete=models.CASCADE)
+
+
+class ProductGroupObjectPermission(GroupObjectPermissionBase):
+    content_object = models.ForeignKey(Product, on_delete=models.CASCADE)
+
+
+class ProductSearchEntry(models.Model):
+    """
+    Row of the SQLite FTS5 table behind product search, see products.search.
+    The table is created and filled by the search backend, not by Django.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_entry'
+    )
+    name = models.TextField()
+    description = models.TextField()
+    # FTS5 exposes the whole row as a hidden column named after the table
+    document = models.TextField(db_column='products_product_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'products_product_fts'
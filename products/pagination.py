@@ -0,0 +1,162 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset (cursor) pagination over a ``(<key>, id)`` ordering.
+
+    Pagination only kicks in when the client sends ``cursor`` or ``page_size``;
+    otherwise ``paginate_queryset`` returns ``None`` and the view answers with
+    a plain list. Cursors carry the ``(<key>, id)`` pair of the page boundary,
+    so each page is a range scan on an index over those two columns and costs
+    the same however deep the client pages.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    # Fields clients may order by. Each one needs an index on (<field>, id).
+    ordering_fields = ()
+    default_ordering = None
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_ordering(self, request):
+        """Return the ``order_by()`` arguments for the requested ordering."""
+        ordering = request.query_params.get(self.ordering_query_param) or self.default_ordering
+        if ordering.lstrip('-') not in self.ordering_fields:
+            choices = ', '.join(f'{field}, -{field}' for field in self.ordering_fields)
+            raise ValidationError({self.ordering_query_param: f"Must be one of: {choices}"})
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.field = self.ordering[0].lstrip('-')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            cursor['v'] = self.to_position(queryset.model, cursor['v'])
+
+        queryset = queryset.order_by(*self.ordering)
+        descending = self.ordering[0].startswith('-')
+        if cursor is not None and cursor['r']:
+            # Walk backwards from the cursor, then flip the page back around.
+            queryset = queryset.reverse()
+            descending = not descending
+        if cursor is not None:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}e': cursor['v']}),
+                Q(**{f'{self.field}__{lookup}': cursor['v']}) | Q(**{f'id__{lookup}': cursor['id']}),
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if cursor is not None and cursor['r']:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = results
+        return results
+
+    def get_position(self, instance):
+        value = getattr(instance, self.field)
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    def to_position(self, model, value):
+        try:
+            return model._meta.get_field(self.field).to_python(value)
+        except FieldDoesNotExist:
+            return value
+        except DjangoValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        payload = {'v': self.get_position(instance), 'id': instance.pk, 'r': int(reverse)}
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            cursor = {'v': str(cursor['v']), 'id': int(cursor['id']), 'r': bool(cursor['r'])}
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_fields(self, view):
+        # Query parameters are documented on the views with swagger_auto_schema.
+        return []
+
+
+class ProductCursorPagination(KeysetPagination):
+    ordering_fields = ('created_at', 'price')
+    default_ordering = 'created_at'
+    search_query_param = 'name'
+
+    def get_ordering(self, request):
+        # Searches are ranked by relevance unless the client picks an order.
+        params = request.query_params
+        if params.get(self.search_query_param) and not params.get(self.ordering_query_param):
+            return ('-search_rank', '-id')
+        return super().get_ordering(request)
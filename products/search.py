@@ -0,0 +1,181 @@
+"""
+Full-text search over product name and description.
+
+Every database gets a backend with the same interface. SQLite keeps an FTS5
+table that is updated from the Product save/delete signals. PostgreSQL uses a
+GIN index over a tsvector expression, which the database maintains itself.
+Anything else falls back to ``icontains``.
+"""
+import re
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import F, FloatField, Lookup, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Product, ProductSearchEntry
+
+TERM_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+
+
+def get_terms(query):
+    """Split a user query into lowercase word terms."""
+    return TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+ProductSearchEntry._meta.get_field('document').register_lookup(Match)
+
+
+class SearchBackend:
+    """
+    Base interface. ``search()`` filters a Product queryset down to matches
+    and annotates each row with a ``search_rank`` (higher is better).
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index(self, product):
+        """Add or refresh a single product in the index."""
+
+    def remove(self, product_id):
+        """Drop a single product from the index."""
+
+    def rebuild(self):
+        """Re-index the whole catalog."""
+
+    def install(self):
+        """Create the index structures (run from a migration)."""
+
+    def uninstall(self):
+        """Drop the index structures (run from a migration)."""
+
+
+class FallbackSearchBackend(SearchBackend):
+    def search(self, queryset, query):
+        condition = Q()
+        for term in get_terms(query):
+            condition &= Q(name__icontains=term) | Q(description__icontains=term)
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    table = ProductSearchEntry._meta.db_table
+    # bm25 column weights: a hit in the name counts more than in the description
+    rank = 'bm25(10.0, 1.0)'
+
+    def match_expression(self, query):
+        # Quoted terms with a trailing * give implicit-AND prefix matching
+        return ' '.join(f'"{term}"*' for term in get_terms(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(search_entry__document__match=match).annotate(
+            search_rank=-F('search_entry__rank')
+        )
+
+    def index(self, product):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) VALUES (%s, %s, %s)',
+                [product.pk, product.name, product.description],
+            )
+
+    def remove(self, product_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [product_id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) '
+                f'SELECT id, name, description FROM {Product._meta.db_table}'
+            )
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5('
+                f"name, description, tokenize = 'porter unicode61', prefix = '2 3')"
+            )
+            # Make the hidden rank column use the weighted bm25
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}, rank) VALUES ('rank', %s)", [self.rank])
+        self.rebuild()
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+
+class PostgresSearchBackend(SearchBackend):
+    index_name = 'product_search_idx'
+    # Must match the indexed expression exactly for the planner to use it
+    document = (
+        "to_tsvector('english', coalesce(\"{table}\".\"name\", '') "
+        "|| ' ' || coalesce(\"{table}\".\"description\", ''))"
+    )
+    weighted_document = (
+        "setweight(to_tsvector('english', coalesce(\"{table}\".\"name\", '')), 'A') "
+        "|| setweight(to_tsvector('english', coalesce(\"{table}\".\"description\", '')), 'B')"
+    )
+
+    def tsquery(self, query):
+        return ' & '.join(f'{term}:*' for term in get_terms(query))
+
+    def search(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        table = Product._meta.db_table
+        document = self.document.format(table=table)
+        weighted = self.weighted_document.format(table=table)
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT id FROM {table} WHERE {document} @@ to_tsquery('english', %s)", [tsquery]
+            )
+        ).annotate(search_rank=RawSQL(
+            f"ts_rank({weighted}, to_tsquery('english', %s))", [tsquery], output_field=FloatField()
+        ))
+
+    def install(self):
+        table = Product._meta.db_table
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.index_name} ON {table} '
+                f'USING GIN (({self.document.format(table=table)}))'
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX IF EXISTS {self.index_name}')
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    backend_class = BACKENDS.get(connections[using].vendor, FallbackSearchBackend)
+    return backend_class(using)
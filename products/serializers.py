@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Product, Category
+from .models import FarmerSummary, Product, Category
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -8,7 +8,9 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 class ProductSerializer(serializers.ModelSerializer):
+    select_related_fields = ('category', 'farmer')
     farmer = serializers.StringRelatedField()
+    available_quantity = serializers.IntegerField(read_only=True)
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(), source='category', write_only=True
@@ -16,4 +18,13 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'price', 'category', 'category_id', 
-                  'quantity_available', 'image', 'harvest_date', 'expiry_date', 'farmer', 'created_at']
+                  'quantity_available', 'available_quantity', 'image', 'harvest_date', 'expiry_date', 'farmer', 'created_at']
+
+class TopProductSerializer(ProductSerializer):
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['units_sold']
+
+class FarmerSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FarmerSummary
+        fields = ['revenue', 'units_sold', 'order_count', 'pending_order_count', 'product_count', 'low_stock_count']
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from carts.models import FarmerOrder, Order, OrderItem
+from users.models import UserProfile
+from .dashboard import invalidate_dashboards
+from .models import Product
+from .search import get_search_backend
+from .summary import refresh_products
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+    get_search_backend(using).index(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    get_search_backend(using).remove(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def refresh_farmer_summary(sender, instance, **kwargs):
+    refresh_products(instance.farmer_id)
+
+
+@receiver(post_delete, sender=Product)
+def refresh_farmer_summary_on_delete(sender, instance, **kwargs):
+    # The farmer may be going too; don't recreate a summary deleted with them.
+    refresh_products(instance.farmer_id, create=False)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_dashboard(sender, instance, **kwargs):
+    invalidate_dashboards([instance.farmer_id])
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_dashboards(sender, instance, created=False, **kwargs):
+    # A new order has no farmers yet; checkout invalidates theirs itself.
+    farmer_ids = [] if created else FarmerOrder.objects.filter(order_id=instance.pk).values_list('farmer_id', flat=True)
+    invalidate_dashboards([instance.buyer_id, *farmer_ids])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_order_item_dashboards(sender, instance, **kwargs):
+    invalidate_dashboards([
+        *Order.objects.filter(pk=instance.order_id).values_list('buyer_id', flat=True),
+        *Product.objects.filter(pk=instance.product_id).values_list('farmer_id', flat=True),
+    ])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_dashboard(sender, instance, **kwargs):
+    # The buyer dashboard embeds the user and their profile
+    invalidate_dashboards([instance.pk])
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_dashboard(sender, instance, **kwargs):
+    invalidate_dashboards([instance.user_id])
@@ -0,0 +1,203 @@
+"""
+Farmer dashboard summaries.
+
+FarmerSummary keeps each farmer's sales and stock counters in one row, so the
+dashboard never aggregates over OrderItem. Checkout adds its sales with
+``record_sale``, inside the transaction that sold the stock. Order status
+changes adjust them with ``record_status_changes``. Product writes recount the
+farmer's product counters with ``refresh_products``, which only reads that
+farmer's products. Anything that bypasses these (admin edits, order
+deletes) is put right by the nightly ``reconcile_farmer_summaries`` command,
+which rebuilds the rows from source with ``rebuild``.
+
+``rebuild`` locks the farmers' product rows before their summary rows, the
+same order checkout takes them in, so the two neither deadlock nor lose a sale.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from carts.models import OrderItem
+from .dashboard import invalidate_dashboards
+from .models import FarmerSummary, Product
+
+CANCELLED = 'cancelled'
+PENDING = 'pending'
+COUNTERS = ('revenue', 'units_sold', 'order_count', 'pending_order_count', 'product_count', 'low_stock_count')
+
+
+def is_low_stock(quantity):
+    return quantity <= settings.LOW_STOCK_THRESHOLD
+
+
+def increment(deltas, field, output_field):
+    """
+    Build an UPDATE value adding ``deltas[farmer_id]`` to ``field`` per row.
+    Counters stop at zero: a row that has drifted low waits for the reconcile
+    instead of failing the write.
+    """
+    return Case(
+        *(
+            When(farmer_id=farmer_id, then=Greatest(F(field) + delta, Value(0), output_field=output_field))
+            for farmer_id, delta in deltas.items()
+        ),
+        default=F(field),
+        output_field=output_field,
+    )
+
+
+def record_sale(products, quantities):
+    """
+    Add one new order to its farmers' summaries. ``products`` maps product ids
+    to their locked rows as read before the sale, ``quantities`` to the units
+    sold. Products whose stock the sale takes down to the low-stock threshold
+    are counted as low stock.
+    """
+    revenue = defaultdict(Decimal)
+    units = defaultdict(int)
+    low_stock = defaultdict(int)
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        revenue[product.farmer_id] += product.price * quantity
+        units[product.farmer_id] += quantity
+        low_stock[product.farmer_id] += (
+            not is_low_stock(product.quantity_available) and is_low_stock(product.quantity_available - quantity)
+        )
+    FarmerSummary.objects.bulk_create([FarmerSummary(farmer_id=farmer_id) for farmer_id in units], ignore_conflicts=True)
+    orders = dict.fromkeys(units, 1)
+    FarmerSummary.objects.filter(farmer_id__in=units).update(
+        revenue=increment(revenue, 'revenue', DecimalField(max_digits=14, decimal_places=2)),
+        units_sold=increment(units, 'units_sold', PositiveIntegerField()),
+        order_count=increment(orders, 'order_count', PositiveIntegerField()),
+        pending_order_count=increment(orders, 'pending_order_count', PositiveIntegerField()),
+        low_stock_count=increment(low_stock, 'low_stock_count', PositiveIntegerField()),
+    )
+
+
+def count_products(farmer_ids):
+    """Return ``{farmer_id: {'product_count': n, 'low_stock_count': n}}``."""
+    counts = {farmer_id: {'product_count': 0, 'low_stock_count': 0} for farmer_id in farmer_ids}
+    rows = Product.objects.filter(farmer_id__in=farmer_ids).values('farmer_id').annotate(
+        product_count=Count('pk'),
+        low_stock_count=Count('pk', filter=Q(quantity_available__lte=settings.LOW_STOCK_THRESHOLD)),
+    )
+    for row in rows:
+        counts[row.pop('farmer_id')] = row
+    return counts
+
+
+def refresh_products(farmer_id, create=True):
+    """
+    Recount ``farmer_id``'s product counters after one of their products was
+    written. With ``create=False`` a missing summary row is left missing, for
+    deletes that may be cascading from the farmer themselves.
+    """
+    counts = count_products([farmer_id])[farmer_id]
+    if create:
+        FarmerSummary.objects.update_or_create(farmer_id=farmer_id, defaults=counts)
+    else:
+        FarmerSummary.objects.filter(farmer_id=farmer_id).update(**counts)
+
+
+def count_sales(farmer_ids):
+    """Return ``{farmer_id: {counter: value}}`` for the sales counters, from OrderItem."""
+    rows = (
+        OrderItem.objects.filter(product__farmer_id__in=farmer_ids).exclude(order__status=CANCELLED)
+        .values('product__farmer_id')
+        .annotate(
+            revenue=Sum(F('price_at_time') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            units_sold=Sum('quantity'),
+            order_count=Count('order', distinct=True),
+            pending_order_count=Count('order', distinct=True, filter=Q(order__status=PENDING)),
+        )
+    )
+    return {row.pop('product__farmer_id'): row for row in rows}
+
+
+def record_status_changes(changes, target, items):
+    """
+    Adjust summaries and ``units_sold`` for orders moving to ``target``.
+    ``changes`` maps order ids to their previous status, ``items`` lists the
+    orders' items as dicts with ``order_id``, ``product_id``, ``farmer_id``,
+    ``quantity`` and ``price_at_time``.
+    A cancelled order's sales no longer count, and its restocked products
+    may stop being low stock. Returns the ids of the farmers involved.
+    """
+    revenue = defaultdict(Decimal)
+    units = defaultdict(int)
+    orders = defaultdict(int)
+    pending = defaultdict(int)
+    product_units = defaultdict(int)
+    seen = set()
+    for item in items:
+        order_id, product_id, farmer_id = item['order_id'], item['product_id'], item['farmer_id']
+        quantity, price = item['quantity'], item['price_at_time']
+        # +1 if the order starts counting, -1 if it stops
+        counted = (target != CANCELLED) - (changes[order_id] != CANCELLED)
+        revenue[farmer_id] += counted * price * quantity
+        units[farmer_id] += counted * quantity
+        product_units[product_id] += counted * quantity
+        if (order_id, farmer_id) not in seen:
+            seen.add((order_id, farmer_id))
+            orders[farmer_id] += counted
+            pending[farmer_id] += (target == PENDING) - (changes[order_id] == PENDING)
+    if not units:
+        return set()
+
+    if any(product_units.values()):
+        Product.objects.filter(pk__in=product_units).update(units_sold=Case(
+            *(
+                When(pk=product_id, then=Greatest(F('units_sold') + delta, Value(0)))
+                for product_id, delta in product_units.items()
+            ),
+            default=F('units_sold'),
+            output_field=PositiveIntegerField(),
+        ))
+    low_stock = {}
+    if target == CANCELLED:
+        low_stock = {farmer_id: counts['low_stock_count'] for farmer_id, counts in count_products(list(units)).items()}
+    FarmerSummary.objects.filter(farmer_id__in=units).update(
+        revenue=increment(revenue, 'revenue', DecimalField(max_digits=14, decimal_places=2)),
+        units_sold=increment(units, 'units_sold', PositiveIntegerField()),
+        order_count=increment(orders, 'order_count', PositiveIntegerField()),
+        pending_order_count=increment(pending, 'pending_order_count', PositiveIntegerField()),
+        low_stock_count=Case(
+            *(When(farmer_id=farmer_id, then=Value(count)) for farmer_id, count in low_stock.items()),
+            default=F('low_stock_count'),
+            output_field=PositiveIntegerField(),
+        ),
+    )
+    return set(units)
+
+
+@transaction.atomic
+def rebuild(farmer_ids):
+    """
+    Recompute ``farmer_ids``' summaries and their products' ``units_sold``
+    from the orders and products. Returns how many summary rows were wrong.
+    """
+    list(Product.objects.select_for_update().filter(farmer_id__in=farmer_ids).order_by('pk').values_list('pk'))
+    sold = (
+        OrderItem.objects.filter(product=OuterRef('pk')).exclude(order__status=CANCELLED)
+        .values('product').annotate(total=Sum('quantity')).values('total')
+    )
+    Product.objects.filter(farmer_id__in=farmer_ids).update(units_sold=Coalesce(Subquery(sold), 0))
+
+    products = count_products(farmer_ids)
+    sales = count_sales(farmer_ids)
+    existing = FarmerSummary.objects.select_for_update().in_bulk(farmer_ids)
+    summaries = []
+    for farmer_id in farmer_ids:
+        summary = FarmerSummary(farmer_id=farmer_id, **products[farmer_id], **sales.get(farmer_id, {}))
+        current = existing.get(farmer_id)
+        if current is None or any(getattr(current, name) != getattr(summary, name) for name in COUNTERS):
+            summaries.append(summary)
+    FarmerSummary.objects.bulk_create(
+        summaries, update_conflicts=True, unique_fields=['farmer'], update_fields=list(COUNTERS),
+    )
+    invalidate_dashboards(farmer_ids)
+    return len(summaries)
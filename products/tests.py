@@ -1,10 +1,19 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
-from .models import  Product, Category
+from .dashboard import LOCK_KEY, PAYLOAD_KEY, get_dashboard, get_stats
+from .models import  FarmerSummary, Product, Category, ProductUserObjectPermission
 from users.models import UserProfile
+from carts.models import Order, OrderItem
+from guardian.models import UserObjectPermission
 from guardian.shortcuts import assign_perm
 from django.urls import reverse
 from datetime import date
@@ -125,6 +134,29 @@ class ProductTests(APITestCase):
         self.assertTrue(self.farmer.has_perm('products.change_product', product))
         self.assertTrue(self.farmer.has_perm('products.delete_product', product))
 
+    def test_create_product_uses_direct_permission_tables(self):
+        """Test that product object permissions are stored in the direct foreign-key table."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        data = {
+            'name': 'Tomatoes',
+            'description': 'Fresh tomatoes',
+            'price': 1.50,
+            'category_id': self.category1.id,
+            'quantity_available': 200,
+            'harvest_date': '2025-08-01',
+            'expiry_date': '2025-12-01'
+        }
+        response = self.client.post(reverse('product-list', kwargs={'version': 'v1'}), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        perms = ProductUserObjectPermission.objects.filter(content_object_id=response.data['id'], user=self.farmer)
+        self.assertEqual(
+            sorted(perms.values_list('permission__codename', flat=True)),
+            ['change_product', 'delete_product', 'view_product']
+        )
+        self.assertFalse(UserObjectPermission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Product)
+        ).exists())
+
     def test_create_product_buyer_denied(self):
         """Test that a buyer cannot create a product."""
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
@@ -142,6 +174,25 @@ class ProductTests(APITestCase):
         self.assertEqual(response.data['detail'], 'You do not have permission to perform this action.')
         self.assertEqual(Product.objects.count(), 2)
 
+    def test_create_product_requires_farmer_role(self):
+        """Test that the add_product permission alone does not let a buyer create products."""
+        self.buyer.user_permissions.add(Permission.objects.get(
+            codename='add_product', content_type=ContentType.objects.get_for_model(Product)
+        ))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        data = {
+            'name': 'Tomatoes',
+            'price': 1.50,
+            'category_id': self.category1.id,
+            'quantity_available': 200,
+            'harvest_date': '2025-08-01',
+            'expiry_date': '2025-12-01'
+        }
+        response = self.client.post(reverse('product-list', kwargs={'version': 'v1'}), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data['detail'], 'Only farmers can perform this action')
+        self.assertEqual(Product.objects.count(), 2)
+
     def test_create_product_invalid_data(self):
         """Test creating a product with invalid data."""
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
@@ -346,4 +397,291 @@ class ProductTests(APITestCase):
         self.assertEqual(product.category, category)
         self.assertEqual(product.farmer, self.farmer)
         self.assertEqual(product.price, 4.00)
-        self.assertEqual(category.name, 'Grains')
\ No newline at end of file
+        self.assertEqual(category.name, 'Grains')
+
+    def create_products(self, count, price=5.00):
+        """Helper to create products visible to the buyer."""
+        products = []
+        for i in range(count):
+            product = Product.objects.create(
+                name=f'Extra {i}',
+                description='Extra produce',
+                price=price,
+                category=self.category1,
+                quantity_available=10,
+                harvest_date=date(2025, 8, 1),
+                expiry_date=date(2025, 12, 1),
+                farmer=self.farmer
+            )
+            assign_perm('view_product', self.buyer, product)
+            products.append(product)
+        return products
+
+    def test_list_products_cursor_pagination(self):
+        """Test walking the product list page by page with next/previous cursors."""
+        self.create_products(5)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['previous'])
+        names = [item['name'] for item in response.data['results']]
+        pages = [names]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([item['name'] for item in response.data['results']])
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(
+            sum(pages, []),
+            ['Carrots', 'Apples', 'Extra 0', 'Extra 1', 'Extra 2', 'Extra 3', 'Extra 4']
+        )
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['name'] for item in response.data['results']], pages[1])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_list_products_ordering_by_price(self):
+        """Test ordering the product list by price with ties broken by id."""
+        extra = self.create_products(3, price=3.00)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(
+            reverse('product-list', kwargs={'version': 'v1'}),
+            {'ordering': '-price', 'page_size': 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [extra[2].id, extra[1].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [extra[0].id, self.product2.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [self.product.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_list_products_paginated_with_filters(self):
+        """Test that filters still apply when the list is paginated."""
+        self.create_products(3)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(
+            reverse('product-list', kwargs={'version': 'v1'}),
+            {'min_price': 2.00, 'max_price': 3.00, 'ordering': 'price', 'page_size': 10}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data['results']], ['Carrots', 'Apples'])
+        self.assertIsNone(response.data['next'])
+
+    def test_list_products_invalid_ordering_and_cursor(self):
+        """Test that unknown ordering keys and malformed cursors are rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'ordering': 'name'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', response.data)
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_products_invalid_farmer(self):
+        """Test that a non-numeric farmer filter is rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'farmer': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('farmer', response.data)
+
+    def test_search_products_description_and_prefix(self):
+        """Test that search covers descriptions and matches word prefixes."""
+        self.product2.description = 'Crisp orchard apples'
+        self.product2.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'name': 'orch'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['Apples'])
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'name': 'fresh carr'})
+        self.assertEqual([item['name'] for item in response.data], ['Carrots'])
+
+    def test_search_products_ranked_by_relevance(self):
+        """Test that name matches rank above description-only matches."""
+        salad = Product.objects.create(
+            name='Salad mix',
+            description='Lettuce with apples and carrots',
+            price=4.00,
+            category=self.category1,
+            quantity_available=10,
+            harvest_date=date(2025, 8, 1),
+            expiry_date=date(2025, 12, 1),
+            farmer=self.farmer
+        )
+        assign_perm('view_product', self.buyer, salad)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'name': 'apples'})
+        self.assertEqual([item['name'] for item in response.data], ['Apples', 'Salad mix'])
+        response = self.client.get(
+            reverse('product-list', kwargs={'version': 'v1'}), {'name': 'apples', 'page_size': 1}
+        )
+        self.assertEqual([item['name'] for item in response.data['results']], ['Apples'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['name'] for item in response.data['results']], ['Salad mix'])
+        self.assertIsNone(response.data['next'])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        """Test that the search index is updated when products change."""
+        self.product.name = 'Beetroot'
+        self.product.description = 'Fresh beetroot'
+        self.product.save()
+        self.product2.delete()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'name': 'carrots'})
+        self.assertEqual(len(response.data), 0)
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'name': 'beet'})
+        self.assertEqual([item['name'] for item in response.data], ['Beetroot'])
+        response = self.client.get(reverse('product-list', kwargs={'version': 'v1'}), {'name': 'apples'})
+        self.assertEqual(len(response.data), 0)
+
+    def test_list_products_query_count(self):
+        """Test that listing products costs a fixed number of queries."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('product-list', kwargs={'version': 'v1'})
+        self.client.get(url)  # warm the content type cache
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        self.create_products(10)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 12)
+
+    def test_dashboard_farmer_query_count(self):
+        """Test that the farmer dashboard costs a fixed number of queries."""
+        def add_orders(count):
+            for product in self.create_products(count):
+                assign_perm('view_product', self.farmer, product)
+                order = Order.objects.create(buyer=self.buyer, total_amount=5.00)
+                OrderItem.objects.create(order=order, product=product, quantity=1, price_at_time=5.00)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        url = reverse('dashboard', kwargs={'version': 'v1'})
+        add_orders(1)
+        self.client.get(url)  # warm the content type cache
+        with self.assertNumQueries(4):
+            self.client.get(url)
+        add_orders(5)
+        call_command('reconcile_farmer_summaries', stdout=StringIO())
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.data['summary']['product_count'], 8)
+        self.assertEqual(len(response.data['top_products']), 5)
+        self.assertEqual(len(response.data['recent_orders']), 5)
+
+    def test_dashboard_buyer_recent_orders_and_summary(self):
+        """Test that the buyer dashboard is bounded and links to the paged history."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('dashboard', kwargs={'version': 'v1'})
+
+        def add_orders(count, status_name='pending'):
+            for _ in range(count):
+                order = Order.objects.create(buyer=self.buyer, total_amount=5.00, status=status_name)
+                OrderItem.objects.create(order=order, product=self.product, quantity=1, price_at_time=5.00)
+
+        add_orders(1)
+        self.client.get(url)  # warm the content type cache
+        with self.assertNumQueries(4):
+            self.client.get(url)
+        add_orders(10)
+        add_orders(1, status_name='cancelled')
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.data['summary'], {'order_count': 11, 'total_spent': '55.00'})
+        self.assertEqual(len(response.data['recent_orders']), 5)
+        self.assertEqual(response.data['recent_orders'][0]['status'], 'cancelled')  # newest first
+        self.assertEqual(
+            response.data['order_history'],
+            'http://testserver' + reverse('orders', kwargs={'version': 'v1'}) + '?page_size=20',
+        )
+
+    @override_settings(DASHBOARD_CACHE_TTL=60)
+    def test_dashboard_cached_until_invalidated(self):
+        """Test that the dashboard is served from cache until a product write invalidates it."""
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        url = reverse('dashboard', kwargs={'version': 'v1'})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['summary']['product_count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_products(1)
+        response = self.client.get(url)
+        self.assertEqual(response.data['summary']['product_count'], 3)
+        self.assertEqual(get_stats(), {'hits': 1, 'misses': 2, 'waits': 0})
+
+    @override_settings(DASHBOARD_CACHE_TTL=60)
+    def test_buyer_dashboard_invalidated_by_user_writes(self):
+        """Test that editing the user or their profile drops the buyer's cached dashboard."""
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        url = reverse('dashboard', kwargs={'version': 'v1'})
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buyer.email = 'new@example.com'
+            self.buyer.save()
+        self.assertEqual(self.client.get(url).data['user']['email'], 'new@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.filter(user=self.buyer).get().save()
+        self.client.get(url)
+        self.assertEqual(get_stats(), {'hits': 0, 'misses': 3, 'waits': 0})
+
+    @override_settings(DASHBOARD_CACHE_TTL=60)
+    def test_dashboard_miss_waits_for_running_recompute(self):
+        """Test that a miss during another request's recompute reuses its result."""
+        cache.clear()
+        cache.add(LOCK_KEY.format(self.farmer.pk, '0'), 1)  # another request is recomputing
+
+        def recompute_finishes(seconds):
+            cache.set(PAYLOAD_KEY.format(self.farmer.pk, '0'), {'shared': True})
+
+        compute = mock.Mock(return_value={'shared': False})
+        with mock.patch('products.dashboard.time.sleep', side_effect=recompute_finishes):
+            self.assertEqual(get_dashboard(self.farmer.pk, compute), {'shared': True})
+        compute.assert_not_called()
+        self.assertEqual(get_stats(), {'hits': 0, 'misses': 1, 'waits': 1})
+
+    def test_dashboard_cache_stats_admin_only(self):
+        """Test that only staff can scrape the dashboard cache counters."""
+        url = reverse('dashboard_cache_stats', kwargs={'version': 'v1'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        staff = User.objects.create_user(username='staff', password='password123', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(staff)}')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'hits', 'misses', 'waits'})
+
+    def test_farmer_summary_follows_product_writes(self):
+        """Test that product writes keep the farmer's product and low-stock counts."""
+        product = self.create_products(1)[0]
+        summary = FarmerSummary.objects.get(farmer=self.farmer)
+        self.assertEqual((summary.product_count, summary.low_stock_count), (3, 1))
+        product.quantity_available = 50
+        product.save()
+        summary.refresh_from_db()
+        self.assertEqual((summary.product_count, summary.low_stock_count), (3, 0))
+        product.delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.product_count, summary.low_stock_count), (2, 0))
+
+    def test_reconcile_farmer_summaries_command(self):
+        """Test that the nightly reconcile rebuilds drifted summaries from the orders."""
+        products = self.create_products(2, price=3.00)
+        for status_name, quantity in (('pending', 2), ('completed', 3), ('cancelled', 4)):
+            order = Order.objects.create(buyer=self.buyer, total_amount=0, status=status_name)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=quantity, price_at_time=3.00) for product in products
+            ])
+        FarmerSummary.objects.filter(farmer=self.farmer).update(product_count=99)
+        out = StringIO()
+        call_command('reconcile_farmer_summaries', stdout=out)
+        self.assertIn('1 corrected', out.getvalue())
+        summary = FarmerSummary.objects.get(farmer=self.farmer)
+        self.assertEqual(summary.revenue, Decimal('30.00'))
+        self.assertEqual(
+            (summary.units_sold, summary.order_count, summary.pending_order_count, summary.product_count),
+            (10, 2, 1, 4),
+        )
+        self.assertEqual(Product.objects.get(pk=products[0].pk).units_sold, 5)
+        out = StringIO()
+        call_command('reconcile_farmer_summaries', stdout=out)
+        self.assertIn('0 corrected', out.getvalue())
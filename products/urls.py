@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, CategoryViewSet, DashboardView
+from .views import ProductViewSet, CategoryViewSet, DashboardCacheStatsView, DashboardView
 
 router = DefaultRouter()
 router.register(r'', ProductViewSet, basename='product')
@@ -8,5 +8,6 @@ router.register(r'categories', CategoryViewSet, basename='category')
 
 urlpatterns = [
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('dashboard/cache-stats/', DashboardCacheStatsView.as_view(), name='dashboard_cache_stats'),
     path('', include(router.urls)),
 ]
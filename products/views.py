@@ -1,55 +1,90 @@
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAuthenticated, DjangoObjectPermissions
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from guardian.shortcuts import assign_perm, get_objects_for_user
 
-from .models import Product, Category
+from django.contrib.auth import get_user_model
+
+from .dashboard import get_dashboard, get_stats
+from .models import FarmerSummary, Product, Category
+from .pagination import ProductCursorPagination
+from .search import get_search_backend
 from carts.models import Order
-from carts.serializers import OrderSerializer
-from .serializers import ( ProductSerializer, CategorySerializer
+from carts.pagination import OrderCursorPagination
+from carts.serializers import OrderSerializer, OrderTotalsSerializer
+from .serializers import ( ProductSerializer, CategorySerializer, FarmerSummarySerializer, TopProductSerializer
 )
 from users.serializers import UserSerializer
+from config.eager_loading import EagerLoadingMixin
+from users.permissions import CachedDjangoObjectPermissions, IsFarmer, is_farmer
+
+User = get_user_model()
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(EagerLoadingMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    permission_classes = (IsAuthenticated,DjangoObjectPermissions,)
+    permission_classes = (IsAuthenticated,CachedDjangoObjectPermissions,)
+    pagination_class = ProductCursorPagination
     def get_queryset(self):
         # Filter products based on view permission
-        return get_objects_for_user(self.request.user, 'products.view_product', Product,accept_global_perms=False)
+        return self.eager_load(
+            get_objects_for_user(self.request.user, 'products.view_product', Product,accept_global_perms=False)
+        )
+    def get_permissions(self):
+        permissions = super().get_permissions()
+        if self.action == 'create':
+            permissions.append(IsFarmer())
+        return permissions
     def perform_create(self, serializer):
-        if not self.request.user.groups.filter(name='Farmers').exists():
-            return Response({"detail": "Only farmers can create products"}, status=status.HTTP_403_FORBIDDEN)
         product = serializer.save(farmer=self.request.user)
         assign_perm('change_product', self.request.user, product)
         assign_perm('delete_product', self.request.user, product)
         assign_perm('view_product', self.request.user, product)
     @swagger_auto_schema(manual_parameters=[
-        openapi.Parameter('name', openapi.IN_QUERY, description="Search by product name", type=openapi.TYPE_STRING),
+        openapi.Parameter('name', openapi.IN_QUERY, description="Full-text search over name and description; results are ranked by relevance unless ordering is given", type=openapi.TYPE_STRING),
         openapi.Parameter('category', openapi.IN_QUERY, description="Filter by category ID", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('farmer', openapi.IN_QUERY, description="Filter by farmer ID", type=openapi.TYPE_INTEGER),
         openapi.Parameter('min_price', openapi.IN_QUERY, description="Minimum price", type=openapi.TYPE_NUMBER),
         openapi.Parameter('max_price', openapi.IN_QUERY, description="Maximum price", type=openapi.TYPE_NUMBER),
+        openapi.Parameter('ordering', openapi.IN_QUERY, description="Sort key: created_at, -created_at, price or -price", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Page size; enables cursor pagination", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor from a previous page's next/previous link", type=openapi.TYPE_STRING),
     ])
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         name = request.query_params.get('name')
         category = request.query_params.get('category')
+        farmer = request.query_params.get('farmer')
         min_price = request.query_params.get('min_price')
         max_price = request.query_params.get('max_price')
         if name:
-            queryset = queryset.filter(name__icontains=name)
+            queryset = get_search_backend().search(queryset, name)
         if category:
             queryset = queryset.filter(category_id=category)
+        if farmer:
+            try:
+                farmer = int(farmer)
+            except ValueError:
+                raise ValidationError({'farmer': "Must be a farmer ID."})
+            queryset = queryset.filter(farmer_id=farmer)
         if min_price:
             queryset = queryset.filter(price__gte=min_price)
         if max_price:
             queryset = queryset.filter(price__lte=max_price)
+        queryset = queryset.order_by(*self.paginator.get_ordering(request))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -59,20 +94,46 @@ class CategoryViewSet(ModelViewSet):
     permission_classes = (IsAuthenticated,)
     http_method_names = ['get']  # Read-only for browsing
 
-class DashboardView(APIView):
+class DashboardView(EagerLoadingMixin, APIView):
     permission_classes = (IsAuthenticated,)
+    recent_orders = 5
+    top_products = 5
     def get(self, request, *args, **kwargs):
-        if request.user.groups.filter(name='Farmers').exists():
-            products = get_objects_for_user(request.user, 'products.view_product', Product,accept_global_perms=False)
-            orders = Order.objects.filter(items__product__farmer=request.user).distinct()
-            data = {
-                'products': ProductSerializer(products, many=True).data,
-                'recent_orders': OrderSerializer(orders[:5], many=True).data
-            }
-        else:
-            orders = Order.objects.filter(buyer=request.user)
-            data = {
-                'user': UserSerializer(request.user).data,
-                'order_history': OrderSerializer(orders, many=True).data
+        data = get_dashboard(request.user.pk, lambda: self.get_data(request))
+        return Response(data, status=status.HTTP_200_OK)
+    def get_data(self, request):
+        if is_farmer(request.user):
+            # Counters are kept up to date by products.summary; farmers who
+            # haven't listed or sold anything yet have no row.
+            summary = FarmerSummary.objects.filter(farmer=request.user).first() or FarmerSummary()
+            products = self.eager_load(
+                Product.objects.filter(farmer=request.user, units_sold__gt=0).order_by('-units_sold', '-pk'),
+                TopProductSerializer,
+            )
+            orders = self.eager_load(
+                Order.objects.for_farmer(request.user), OrderSerializer
+            )
+            return {
+                'summary': FarmerSummarySerializer(summary).data,
+                'top_products': TopProductSerializer(products[:self.top_products], many=True).data,
+                'recent_orders': OrderSerializer(orders[:self.recent_orders], many=True).data
             }
-        return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file
+        orders = self.eager_load(Order.objects.for_buyer(request.user), OrderSerializer)
+        # request.user only carries the token claims; render the full row
+        user = self.eager_load(User.objects.all(), UserSerializer).get(pk=request.user.pk)
+        # The full history is paged by the orders endpoint
+        history = reverse('orders', request=request)
+        return {
+            'user': UserSerializer(user, context={'request': request}).data,
+            'summary': OrderTotalsSerializer(Order.objects.filter(buyer=request.user).get_totals()).data,
+            'recent_orders': OrderSerializer(orders[:self.recent_orders], many=True).data,
+            'order_history': replace_query_param(
+                history, OrderCursorPagination.page_size_query_param, OrderCursorPagination.page_size
+            ),
+        }
+
+class DashboardCacheStatsView(APIView):
+    """Dashboard cache hit, miss and wait counters, for metrics scraping."""
+    permission_classes = (IsAdminUser,)
+    def get(self, request, *args, **kwargs):
+        return Response(get_stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+User = get_user_model()
+
+ROLE_CLAIM = 'role'
+# Claims copied onto the token user; everything else is loaded on first access.
+USER_CLAIMS = ('username', 'is_superuser', 'is_staff')
+
+
+class RoleTokenAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the user from the token claims.
+
+    The user is a User instance with only the claimed fields loaded (the rest
+    are deferred, as with ``.only()``), so permission checks and foreign-key
+    assignments work without fetching the row. Reading another field loads it
+    on demand, and ``save()`` only writes the loaded fields. Tokens issued
+    before the role claim existed fall back to the database lookup.
+
+    The trade-off is that a deactivated user keeps access until their access
+    token expires.
+    """
+
+    def get_user(self, validated_token):
+        if ROLE_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        values = {api_settings.USER_ID_FIELD: user_id, 'is_active': True}
+        values.update((claim, validated_token.get(claim)) for claim in USER_CLAIMS)
+        fields = [field for field in User._meta.concrete_fields if field.attname in values]
+        user = User.from_db(
+            router.db_for_read(User),
+            [field.attname for field in fields],
+            [field.to_python(values[field.attname]) for field in fields],
+        )
+        user.role = validated_token[ROLE_CLAIM]
+        return user
@@ -0,0 +1,142 @@
+"""
+Per-process Bloom filter in front of the refresh-token blacklist.
+
+With ``TOKEN_BLACKLIST_FILTER_CAPACITY`` set, each process keeps a Bloom filter
+of the jtis of unexpired blacklisted tokens. A refresh token whose jti is not
+in the filter is certainly not blacklisted, so the usual case skips the
+database. A hit (a blacklisted token or a rare false positive) falls through
+to simplejwt's query.
+
+Blacklisting a token bumps a counter in the cache, once the write commits.
+This hangs off BlacklistedToken's ``post_save`` (see users.signals), so it
+covers every way a token is blacklisted: rotation, logout, the admin or a
+plain ORM write. Only ``bulk_create`` skips it. A process that sees the counter move past what it knows reloads the tokens
+blacklisted since its last sync. Its own blacklisting is added directly and
+needs no reload. This relies on a cache shared by every process, so keep the
+filter off (the default) with the per-process local-memory cache.
+"""
+import hashlib
+import math
+import random
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+VERSION_KEY = 'token_blacklist:version'
+# Reloads also cover this much time before the last sync, for transactions that committed late
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter of strings, sized for ``capacity`` entries at ``error_rate`` false positives."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        # Double hashing: two 64-bit halves of one digest stand in for k hash functions
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A random start, so a counter evicted from the cache can't come back at a value a process already has
+        cache.add(VERSION_KEY, random.randrange(1 << 62), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+        return cache.incr(VERSION_KEY)
+
+
+class BlacklistFilter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = None
+        self.synced_at = None
+
+    @property
+    def enabled(self):
+        return bool(settings.TOKEN_BLACKLIST_FILTER_CAPACITY)
+
+    def sync(self):
+        version = get_version()
+        capacity = settings.TOKEN_BLACKLIST_FILTER_CAPACITY
+        full = self.bloom is None or self.bloom.count > self.bloom.capacity
+        if not full and version == self.version:
+            return
+        now = timezone.now()
+        tokens = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        if full:
+            # Grow with the blacklist; pruning keeps it to unexpired tokens
+            self.bloom = BloomFilter(max(capacity, 2 * tokens.count()), settings.TOKEN_BLACKLIST_FILTER_ERROR_RATE)
+        else:
+            tokens = tokens.filter(blacklisted_at__gte=self.synced_at - SYNC_OVERLAP)
+        for jti in tokens.values_list('token__jti', flat=True).iterator():
+            self.bloom.add(jti)
+        self.version, self.synced_at = version, now
+
+    def might_contain(self, jti):
+        """False only if ``jti`` is certainly not blacklisted."""
+        with self.lock:
+            self.sync()
+            return jti in self.bloom
+
+    def record(self, jti):
+        """Add a jti this process just blacklisted, and tell the other processes once it commits."""
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+        def publish():
+            version = bump_version()
+            with self.lock:
+                # Ours was the only change since the last sync, so the filter is still complete
+                if self.version is not None and version == self.version + 1:
+                    self.version = version
+
+        transaction.on_commit(publish)
+
+    def clear(self):
+        with self.lock:
+            self.bloom = self.version = self.synced_at = None
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken that asks the process's Bloom filter before querying the blacklist."""
+
+    def check_blacklist(self):
+        if blacklist_filter.enabled and not blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            return
+        super().check_blacklist()
@@ -0,0 +1,35 @@
+"""
+Password hashers whose cost comes from settings.
+
+``PASSWORD_HASHER_POLICY`` picks which of these hashes new passwords; see
+``PASSWORD_HASHERS`` in the settings. Django rehashes a password when its
+user next logs in if the stored hash was made by another hasher or with other
+cost parameters (``must_update``). Changing the policy or its cost therefore
+upgrades (or cheapens) hashes transparently, with no reset needed. The
+algorithm names are Django's own, so existing hashes keep verifying.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    # Only a cap: enough to verify hashes made with a work factor up to 2**18 at block size 8
+    maxmem = 512 * 1024 * 1024
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+User = get_user_model()
+
+PASSWORD = 'benchmark-password-1!'
+
+
+class Command(BaseCommand):
+    help = "Measures logins per second per core for each password hashing policy and cost"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20, help="Timed logins per configuration")
+        parser.add_argument(
+            '--pbkdf2-iterations', type=int, nargs='+', default=[settings.PASSWORD_PBKDF2_ITERATIONS],
+            help="PBKDF2 iteration counts to try",
+        )
+        parser.add_argument(
+            '--scrypt-work-factor', type=int, nargs='+', default=[settings.PASSWORD_SCRYPT_WORK_FACTOR],
+            help="scrypt work factors (powers of two) to try",
+        )
+
+    def handle(self, *args, **kwargs):
+        configurations = [
+            ('pbkdf2', f"iterations={iterations}", {'PASSWORD_PBKDF2_ITERATIONS': iterations})
+            for iterations in kwargs['pbkdf2_iterations']
+        ] + [
+            ('scrypt', f"work_factor={work_factor}", {'PASSWORD_SCRYPT_WORK_FACTOR': work_factor})
+            for work_factor in kwargs['scrypt_work_factor']
+        ]
+        # The benchmark user is created inside a transaction that is rolled back at the end.
+        with transaction.atomic():
+            user = User.objects.create_user(username='benchmark_login', password=None)
+            self.stdout.write(f"{'policy':8} {'cost':22} {'ms/login':>10} {'logins/s/core':>14}")
+            for policy, cost, overrides in configurations:
+                hashers = [settings.PASSWORD_HASHER_POLICIES[policy], *settings.PASSWORD_HASHERS]
+                with override_settings(PASSWORD_HASHERS=hashers, **overrides):
+                    user.set_password(PASSWORD)
+                    user.save(update_fields=['password'])
+                    cpu = self.time(user.username, kwargs['logins'])
+                per_login = cpu / kwargs['logins']
+                self.stdout.write(f"{policy:8} {cost:22} {per_login * 1000:10.2f} {1 / per_login:14.1f}")
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark completed, benchmark user rolled back."))
+
+    def time(self, username, logins):
+        """CPU seconds spent on ``logins`` logins; hashing is single-threaded, so this is per core."""
+        authenticate(username=username, password=PASSWORD)  # warm up
+        start = time.process_time()
+        for _ in range(logins):
+            if authenticate(username=username, password=PASSWORD) is None:
+                raise CommandError("Benchmark login failed")
+        return time.process_time() - start
@@ -0,0 +1,29 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import UserProfile
+from users.provisioning import provision_users
+from users.serializers import ProvisionUserSerializer
+
+
+class Command(BaseCommand):
+    help = "Onboards users of one role from a CSV roster with username and email columns (password optional)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help='Path to the CSV roster')
+        parser.add_argument('--role', choices=[role for role, _ in UserProfile.ROLE_CHOICES], default='farmer')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users to create per transaction')
+
+    def handle(self, *args, **options):
+        with open(options['roster'], newline='') as roster:
+            rows = list(csv.DictReader(roster))
+        serializer = ProvisionUserSerializer(data=rows, many=True)
+        if not serializer.is_valid():
+            # Line 1 is the header
+            errors = [f"line {index + 2}: {error}" for index, error in enumerate(serializer.errors) if error]
+            raise CommandError("Invalid roster:\n" + '\n'.join(errors))
+        created, skipped = provision_users(serializer.validated_data, options['role'], options['batch_size'])
+        for username in skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {username}: username or email taken"))
+        self.stdout.write(self.style.SUCCESS(f"Provisioned {len(created)} {options['role']}s, skipped {len(skipped)}."))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+
+class Command(BaseCommand):
+    help = "Deletes expired outstanding refresh tokens and their blacklist entries, in short batches (run periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tokens to delete per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('pk')
+        deleted = last = 0
+        while True:
+            # expires_at has no index; walking the primary key from the last batch reads each row once
+            batch = list(expired.filter(pk__gt=last).values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1]
+            # Cascades to the tokens' BlacklistedToken rows
+            OutstandingToken.objects.filter(pk__in=batch).delete()
+            deleted += len(batch)
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} expired refresh tokens."))
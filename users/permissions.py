@@ -0,0 +1,162 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from guardian.core import ObjectPermissionChecker
+from rest_framework.permissions import SAFE_METHODS, BasePermission, DjangoObjectPermissions
+
+FARMER = 'farmer'
+BUYER = 'buyer'
+ROLE_GROUPS = {FARMER: 'Farmers', BUYER: 'Buyers'}
+
+USER_VERSION_KEY = 'objperms:version:user:{}'
+GROUPS_VERSION_KEY = 'objperms:version:groups'
+
+
+def invalidate_object_permissions(user_id=None):
+    """
+    Drop shared cache entries for one user's object permissions, or for
+    everyone when ``user_id`` is None (group permissions changed).
+    """
+    key = USER_VERSION_KEY.format(user_id) if user_id is not None else GROUPS_VERSION_KEY
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+class CachedObjectPermissionChecker(ObjectPermissionChecker):
+    """
+    ObjectPermissionChecker backed by the shared cache.
+
+    Within a checker, guardian already memoizes perms per object. When
+    ``OBJECT_PERMISSION_CACHE_TTL`` is set, the codenames are also shared
+    across requests under keys that embed the user's permission version and
+    the global group version, so bumping either invalidates them.
+    """
+
+    def __init__(self, user_or_group=None, ttl=None):
+        super().__init__(user_or_group)
+        self.ttl = settings.OBJECT_PERMISSION_CACHE_TTL if ttl is None else ttl
+        self._version = None
+
+    @property
+    def shared(self):
+        return bool(self.ttl) and self.user is not None and self.user.is_active
+
+    def get_shared_key(self, local_key):
+        if self._version is None:
+            version_keys = [USER_VERSION_KEY.format(self.user.pk), GROUPS_VERSION_KEY]
+            versions = cache.get_many(version_keys)
+            self._version = ':'.join(versions.get(key, '0') for key in version_keys)
+        ctype_id, pk = local_key
+        return f'objperms:{self.user.pk}:{self._version}:{ctype_id}:{pk}'
+
+    def get_perms(self, obj):
+        key = self.get_local_cache_key(obj)
+        if not self.shared or key in self._obj_perms_cache:
+            return super().get_perms(obj)
+        shared_key = self.get_shared_key(key)
+        perms = cache.get(shared_key)
+        if perms is None:
+            perms = super().get_perms(obj)
+            cache.set(shared_key, perms, self.ttl)
+        self._obj_perms_cache[key] = perms
+        return perms
+
+    def prefetch_perms(self, objects):
+        """Load perms for all ``objects`` in one round trip (two queries)."""
+        missing = {
+            self.get_local_cache_key(obj): obj for obj in objects
+            if self.get_local_cache_key(obj) not in self._obj_perms_cache
+        }
+        if not missing:
+            return True
+        shared_keys = {}
+        if self.shared:
+            shared_keys = {self.get_shared_key(key): key for key in missing}
+            for shared_key, perms in cache.get_many(shared_keys).items():
+                key = shared_keys[shared_key]
+                self._obj_perms_cache[key] = perms
+                del missing[key]
+            if not missing:
+                return True
+        result = super().prefetch_perms(list(missing.values()))
+        if shared_keys:
+            cache.set_many({
+                shared_key: self._obj_perms_cache.get(key, [])
+                for shared_key, key in shared_keys.items() if key in missing
+            }, self.ttl)
+        return result
+
+
+def get_permission_checker(request):
+    """Return the permission checker memoized on ``request`` for its user."""
+    checker = getattr(request, '_object_permission_checker', None)
+    if checker is None or checker.user != request.user:
+        checker = CachedObjectPermissionChecker(request.user)
+        request._object_permission_checker = checker
+    return checker
+
+
+class CachedDjangoObjectPermissions(DjangoObjectPermissions):
+    """DjangoObjectPermissions that answers object checks from the request's checker."""
+
+    def has_object_permission(self, request, view, obj):
+        model_cls = self._queryset(view).model
+        checker = get_permission_checker(request)
+
+        def has_perms(perms):
+            return all(checker.has_perm(perm, obj) for perm in perms)
+
+        if not has_perms(self.get_required_object_permissions(request.method, model_cls)):
+            # Same semantics as DjangoObjectPermissions: hide objects the
+            # user cannot even read.
+            if request.method in SAFE_METHODS:
+                raise Http404
+            if not has_perms(self.get_required_object_permissions('GET', model_cls)):
+                raise Http404
+            return False
+        return True
+
+
+def load_role(user):
+    """Read a user's role from group membership, falling back to the profile."""
+    group_roles = {group: role for role, group in ROLE_GROUPS.items()}
+    group = user.groups.filter(name__in=group_roles).values_list('name', flat=True).first()
+    if group is not None:
+        return group_roles[group]
+    from .models import UserProfile
+    return UserProfile.objects.filter(user=user).values_list('role', flat=True).first()
+
+
+def get_role(user):
+    """
+    Return ``user``'s role. Users authenticated from a token carry it as an
+    attribute; anyone else is looked up once and the answer kept on the user.
+    """
+    if not user.is_authenticated:
+        return None
+    if not hasattr(user, 'role'):
+        user.role = load_role(user)
+    return user.role
+
+
+def is_farmer(user):
+    return get_role(user) == FARMER
+
+
+def is_buyer(user):
+    return get_role(user) == BUYER
+
+
+class IsFarmer(BasePermission):
+    message = 'Only farmers can perform this action'
+
+    def has_permission(self, request, view):
+        return is_farmer(request.user)
+
+
+class IsBuyer(BasePermission):
+    message = 'Only buyers can perform this action'
+
+    def has_permission(self, request, view):
+        return is_buyer(request.user)
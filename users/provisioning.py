@@ -0,0 +1,119 @@
+"""
+Account creation: single registrations and bulk onboarding.
+
+A user, their profile, their role group membership, the ``change_user``
+permission on themselves and (for buyers) their cart are all created in one
+transaction. A failure part-way therefore leaves nothing behind. The role
+group ids and the permission id are looked up once per process, then kept
+until a Group changes (see users.signals).
+
+``provision_users`` does the same for a whole roster of one role, with a
+``bulk_create`` per table in each batch instead of several queries per user.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.functions import Lower
+from guardian.models import UserObjectPermission
+
+from carts.models import Cart
+from .models import UserProfile
+from .permissions import BUYER, ROLE_GROUPS
+
+User = get_user_model()
+
+_role_setup = {}
+
+
+def clear_role_setup():
+    _role_setup.clear()
+
+
+def get_role_setup():
+    """Return ``(group ids by role, change_user permission id, User content type id)``, cached per process."""
+    if not _role_setup:
+        groups = dict(Group.objects.filter(name__in=ROLE_GROUPS.values()).values_list('name', 'pk'))
+        missing = set(ROLE_GROUPS.values()) - set(groups)
+        if missing:
+            raise Group.DoesNotExist(f"Missing role groups: {', '.join(sorted(missing))}")
+        content_type = ContentType.objects.get_for_model(User)
+        permission = Permission.objects.get(content_type=content_type, codename='change_user')
+        _role_setup.update(
+            group_ids={role: groups[name] for role, name in ROLE_GROUPS.items()},
+            permission_id=permission.pk,
+            content_type_id=content_type.pk,
+        )
+    return _role_setup['group_ids'], _role_setup['permission_id'], _role_setup['content_type_id']
+
+
+def set_up_accounts(users, role):
+    """Create the profiles, group memberships, self permissions and carts of new ``users`` of ``role``."""
+    group_ids, permission_id, content_type_id = get_role_setup()
+    UserProfile.objects.bulk_create([UserProfile(user=user, role=role) for user in users])
+    # New users have nothing cached, so skipping the m2m and permission signals is safe
+    User.groups.through.objects.bulk_create([
+        User.groups.through(user_id=user.pk, group_id=group_ids[role]) for user in users
+    ])
+    UserObjectPermission.objects.bulk_create([
+        UserObjectPermission(
+            user_id=user.pk, permission_id=permission_id, content_type_id=content_type_id, object_pk=str(user.pk),
+        )
+        for user in users
+    ])
+    if role == BUYER:
+        Cart.objects.bulk_create([Cart(buyer=user) for user in users])
+
+
+@transaction.atomic
+def register_user(username, email, password, role):
+    """Create a fully set up account, or nothing if any step fails."""
+    user = User.objects.create_user(username=username, email=email, password=password)
+    set_up_accounts([user], role)
+    return user
+
+
+def provision_users(rows, role, batch_size=500):
+    """
+    Create accounts of ``role`` for ``rows`` of ``{'username', 'email'[, 'password']}``.
+    Emails are stored as given, like ``register_user``; the serializers
+    lowercase them. Rows without a password get an unusable one, to be set
+    through a password reset. Rows whose username or email is taken (ignoring
+    case), by an existing user or an earlier row, are skipped. Each batch is
+    its own transaction. Returns ``(created, skipped)`` lists of usernames.
+    """
+    created, skipped = [], []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        with transaction.atomic():
+            taken = set(
+                User.objects.annotate(lower_username=Lower('username'))
+                .filter(lower_username__in=[row['username'].lower() for row in batch])
+                .values_list('lower_username', flat=True)
+            )
+            taken_emails = set(
+                User.objects.annotate(lower_email=Lower('email'))
+                .filter(lower_email__in=[row['email'].lower() for row in batch])
+                .values_list('lower_email', flat=True)
+            )
+            users = []
+            for row in batch:
+                key, email_key = row['username'].lower(), row['email'].lower()
+                if key in taken or email_key in taken_emails:
+                    skipped.append(row['username'])
+                    continue
+                taken.add(key)
+                taken_emails.add(email_key)
+                users.append(User(
+                    username=row['username'], email=row['email'], password=make_password(row.get('password') or None),
+                ))
+            User.objects.bulk_create(users)
+            if users and users[0].pk is None:
+                # The database can't return ids from a bulk insert
+                ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+                for user in users:
+                    user.pk = ids[user.username]
+            set_up_accounts(users, role)
+            created += [user.username for user in users]
+    return created, skipped
@@ -1,13 +1,34 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+from config.eager_loading import eager_load
+from products.models import Product
+from products.pagination import ProductCursorPagination
 from products.serializers import ProductSerializer
 from .models import UserProfile
+from .authentication import ROLE_CLAIM, USER_CLAIMS
+from .blacklist import FilteredRefreshToken
+from .permissions import FARMER, load_role
 import re
 
 User = get_user_model()
 
 
+def validate_password_complexity(value):
+    """Check the length, digit and special character rules every new password must meet."""
+    if len(value) < 8:
+        raise ValidationError("Password must be at least 8 characters long.")
+    if not re.search(r'\d', value):
+        raise ValidationError("Password must contain at least one number.")
+    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', value):
+        raise ValidationError("Password must contain at least one special character.")
+    return value
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
@@ -15,12 +36,62 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    """
+    A user with their product count and a link to page through their products.
+    The catalog itself is only embedded, up to ``embed_products`` items, when
+    that is given in the context, so the cost doesn't grow with its size.
+    """
+    select_related_fields = ('farmer_summary',)
     profile = UserProfileSerializer()
-    products = ProductSerializer(many=True, read_only=True)
-    
+    product_count = serializers.SerializerMethodField()
+    products_url = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'profile', 'products']
+        fields = ['id', 'username', 'email', 'profile', 'product_count', 'products_url']
+
+    def get_product_count(self, user):
+        # Kept by products.summary; users who never listed a product have no row
+        summary = getattr(user, 'farmer_summary', None)
+        return summary.product_count if summary is not None else 0
+
+    def get_products_url(self, user):
+        request = self.context.get('request')
+        if request is None or getattr(getattr(user, 'profile', None), 'role', None) != FARMER:
+            return None
+        url = reverse('product-list', request=request)
+        url = replace_query_param(url, 'farmer', user.pk)
+        return replace_query_param(url, ProductCursorPagination.page_size_query_param, ProductCursorPagination.page_size)
+
+    def to_representation(self, user):
+        data = super().to_representation(user)
+        limit = self.context.get('embed_products')
+        if limit:
+            products = eager_load(Product.objects.filter(farmer=user).order_by('created_at', 'id'), ProductSerializer)
+            data['products'] = ProductSerializer(products[:limit], many=True, context=self.context).data
+        return data
+
+
+class UserQuerySerializer(serializers.Serializer):
+    embed = serializers.ChoiceField(choices=['products'], required=False, help_text="Embed the user's first products")
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20, help_text="Products to embed")
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issue tokens carrying the claims RoleTokenAuthentication builds users from."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token[ROLE_CLAIM] = load_role(user)
+        return token
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh with the blacklist check answered by the process's filter when it can be."""
+    token_class = FilteredRefreshToken
 
 
 class RegisterSerializer(serializers.Serializer):
@@ -49,13 +120,7 @@ class RegisterSerializer(serializers.Serializer):
 
     def validate_password(self, value):
         """Validate password complexity."""
-        if len(value) < 8:
-            raise ValidationError("Password must be at least 8 characters long.")
-        if not re.search(r'\d', value):
-            raise ValidationError("Password must contain at least one number.")
-        if not re.search(r'[!@#$%^&*(),.?":{}|<>]', value):
-            raise ValidationError("Password must contain at least one special character.")
-        return value
+        return validate_password_complexity(value)
 
     def validate(self, attrs):
         """Validate that passwords match."""
@@ -63,4 +128,38 @@ class RegisterSerializer(serializers.Serializer):
         password2 = attrs.get("password2")
         if password != password2:
             raise ValidationError({"password2": "Passwords do not match."})
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class ProvisionUserSerializer(serializers.Serializer):
+    username = serializers.RegexField(r'^[a-zA-Z0-9_]{3,150}$', max_length=150)
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField(write_only=True, required=False, allow_blank=True)
+
+    def validate_email(self, value):
+        """Normalize email to lowercase, as registration does."""
+        return value.lower()
+
+    def validate_password(self, value):
+        """Apply registration's complexity rules; a blank password means none is set."""
+        return validate_password_complexity(value) if value else value
+
+
+class ProvisionSerializer(serializers.Serializer):
+    role = serializers.ChoiceField(choices=UserProfile.ROLE_CHOICES, default='farmer')
+    users = ProvisionUserSerializer(many=True, allow_empty=False, max_length=1000)
+
+    def validate_users(self, value):
+        """Cap the rows with a password, since each one is hashed within the request."""
+        passwords = sum(1 for row in value if row.get('password'))
+        if passwords > settings.PROVISION_MAX_PASSWORDS:
+            raise ValidationError(
+                f"At most {settings.PROVISION_MAX_PASSWORDS} users may have a password per request, got {passwords}. "
+                "Leave passwords out to have users set them by reset, or use the provision_users command."
+            )
+        return value
+
+
+class ProvisionResultSerializer(serializers.Serializer):
+    created = serializers.ListField(child=serializers.CharField())
+    skipped = serializers.ListField(child=serializers.CharField())
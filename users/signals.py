@@ -0,0 +1,56 @@
+from django.apps import apps
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from guardian.models import GroupObjectPermissionBase, UserObjectPermissionBase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .blacklist import blacklist_filter
+from .permissions import invalidate_object_permissions
+from .provisioning import clear_role_setup
+
+
+def invalidate_user_permissions(sender, instance, **kwargs):
+    invalidate_object_permissions(instance.user_id)
+
+
+def invalidate_group_permissions(sender, instance, **kwargs):
+    invalidate_object_permissions()
+
+
+def invalidate_group_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_object_permissions(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            invalidate_object_permissions(user_id)
+    else:
+        # group.user_set.clear() does not say which users were removed
+        invalidate_object_permissions()
+
+
+def forget_role_groups(sender, **kwargs):
+    clear_role_setup()
+
+
+def record_blacklisted_token(sender, instance, created, raw, **kwargs):
+    if created and not raw and blacklist_filter.enabled:
+        blacklist_filter.record(instance.token.jti)
+
+
+def connect():
+    # Covers guardian's generic tables and every direct foreign-key table.
+    for model in apps.get_models():
+        if issubclass(model, UserObjectPermissionBase):
+            handler = invalidate_user_permissions
+        elif issubclass(model, GroupObjectPermissionBase):
+            handler = invalidate_group_permissions
+        else:
+            continue
+        post_save.connect(handler, sender=model, dispatch_uid=f'objperms_save_{model._meta.label}')
+        post_delete.connect(handler, sender=model, dispatch_uid=f'objperms_delete_{model._meta.label}')
+    m2m_changed.connect(invalidate_group_membership, sender=User.groups.through, dispatch_uid='objperms_groups')
+    post_save.connect(forget_role_groups, sender=Group, dispatch_uid='role_groups_save')
+    post_delete.connect(forget_role_groups, sender=Group, dispatch_uid='role_groups_delete')
+    post_save.connect(record_blacklisted_token, sender=BlacklistedToken, dispatch_uid='token_blacklist_save')
@@ -1,14 +1,28 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.cache import cache
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from users.models import UserProfile
-from products.models import Product
+from products.models import Category, Product
 from carts.models import Cart
-from guardian.shortcuts import assign_perm
+from guardian.shortcuts import assign_perm, remove_perm
+from users.blacklist import BlacklistFilter, BloomFilter, blacklist_filter
+from users.permissions import CachedObjectPermissionChecker, get_permission_checker
 from django.urls import reverse
-from datetime import date
+from datetime import date, timedelta
 
 # Existing CartTests, OrderTests, and ProductTests classes (unchanged, omitted for brevity)
 
@@ -154,6 +168,124 @@ class UserTests(APITestCase):
         self.assertIn('password', response.data)
         self.assertEqual(User.objects.count(), 3)
 
+    def register(self, username, role):
+        return self.client.post(reverse('users:register-view', kwargs={'version': 'v1'}), {
+            'username': username, 'email': f'{username}@example.com',
+            'password': 'password1!', 'password2': 'password1!', 'role': role,
+        }, format='json')
+
+    def test_register_is_atomic(self):
+        """Test that a failure part-way through registration leaves no half-created user."""
+        with mock.patch('users.provisioning.Cart.objects.bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError), self.assertLogs('django.request', 'ERROR'):
+                self.register('buyer3', 'buyer')
+        self.assertFalse(User.objects.filter(username='buyer3').exists())
+        self.assertEqual(self.register('buyer3', 'buyer').status_code, status.HTTP_201_CREATED)
+        user = User.objects.get(username='buyer3')
+        self.assertTrue(user.groups.filter(name='Buyers').exists())
+        self.assertTrue(user.has_perm('auth.change_user', user))
+        self.assertTrue(Cart.objects.filter(buyer=user).exists())
+
+    def test_register_resolves_groups_once(self):
+        """Test that the role groups are looked up once, not on every registration."""
+        self.register('farmer3', 'farmer')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.register('farmer4', 'farmer').status_code, status.HTTP_201_CREATED)
+        self.assertFalse([query for query in queries if 'auth_group"' in query['sql'] and 'SELECT' in query['sql']])
+        self.assertTrue(User.objects.get(username='farmer4').groups.filter(name='Farmers').exists())
+
+    def test_provision_users_command(self):
+        """Test that a roster is onboarded in bulk and taken usernames are skipped."""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as roster:
+            roster.write('username,email,password\nFarmer1,dup@example.com,\ncoop_a,A@Example.com,\ncoop_b,b@example.com,password1!\n')
+        self.addCleanup(os.remove, roster.name)
+        out = StringIO()
+        call_command('provision_users', roster.name, '--batch-size', '1', stdout=out)
+        self.assertIn('Provisioned 2 farmers, skipped 1.', out.getvalue())
+        coop_a, coop_b = User.objects.filter(username__startswith='coop_').order_by('username')
+        self.assertEqual(coop_a.email, 'a@example.com')
+        self.assertFalse(coop_a.has_usable_password())
+        self.assertTrue(coop_b.check_password('password1!'))
+        for user in (coop_a, coop_b):
+            self.assertEqual(user.profile.role, 'farmer')
+            self.assertTrue(user.groups.filter(name='Farmers').exists())
+            self.assertTrue(user.has_perm('auth.change_user', user))
+            self.assertFalse(Cart.objects.filter(buyer=user).exists())
+
+    def test_provision_users_applies_registration_rules(self):
+        """Test that provisioning rejects weak passwords and skips taken or repeated emails."""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as roster:
+            roster.write('username,email,password\ncoop_a,a@example.com,a\n')
+        self.addCleanup(os.remove, roster.name)
+        with self.assertRaisesMessage(CommandError, 'line 2'):
+            call_command('provision_users', roster.name, stdout=StringIO())
+        with open(roster.name, 'w') as rewritten:
+            rewritten.write(
+                'username,email,password\ncoop_a,Buyer1@Example.com,\ncoop_b,b@example.com,\ncoop_c,B@example.com,\n'
+            )
+        out = StringIO()
+        call_command('provision_users', roster.name, stdout=out)
+        self.assertIn('Provisioned 1 farmers, skipped 2.', out.getvalue())
+        self.assertEqual(list(User.objects.filter(username__startswith='coop_').values_list('username', flat=True)), ['coop_b'])
+
+    def test_provision_view(self):
+        """Test that only staff can provision users, with a fixed number of inserts per batch."""
+        url = reverse('users:provision-view', kwargs={'version': 'v1'})
+        data = {'role': 'buyer', 'users': [{'username': f'member{i}', 'email': f'member{i}@example.com'} for i in range(20)]}
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        self.assertEqual(self.client.post(url, data, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        User.objects.filter(pk=self.farmer.pk).update(is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((len(response.data['created']), response.data['skipped']), (20, []))
+        self.assertEqual(Cart.objects.filter(buyer__username__startswith='member').count(), 20)
+        invalid = {'users': [{'username': 'no spaces', 'email': 'x@example.com'}]}
+        self.assertEqual(self.client.post(url, invalid, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PROVISION_MAX_PASSWORDS=2)
+    def test_provision_view_caps_passwords(self):
+        """Test that a request may only carry a few rows with passwords to hash."""
+        url = reverse('users:provision-view', kwargs={'version': 'v1'})
+        User.objects.filter(pk=self.farmer.pk).update(is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        rows = [{'username': f'member{i}', 'email': f'Member{i}@Example.com', 'password': 'password1!'} for i in range(3)]
+        response = self.client.post(url, {'users': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('users', response.data)
+        response = self.client.post(url, {'users': rows[:2] + [{**rows[2], 'password': ''}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(User.objects.get(username='member0').email, 'member0@example.com')
+
+    @override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2**10)
+    def test_login_rehashes_to_current_policy(self):
+        """Test that logging in upgrades a hash made under another policy or cost."""
+        scrypt_first = ['users.hashers.ScryptPasswordHasher', 'users.hashers.PBKDF2PasswordHasher']
+        self.assertTrue(self.farmer.password.startswith('pbkdf2_sha256$'))
+        with override_settings(PASSWORD_HASHERS=scrypt_first):
+            self.authenticate(self.farmer)
+            self.farmer.refresh_from_db()
+            self.assertTrue(self.farmer.password.startswith('scrypt$1024$'))
+            with override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2**11):
+                self.authenticate(self.farmer)
+                self.farmer.refresh_from_db()
+                self.assertTrue(self.farmer.password.startswith('scrypt$2048$'))
+        # Hashes made under the other policy still verify after switching back
+        self.authenticate(self.farmer)
+        self.farmer.refresh_from_db()
+        self.assertTrue(self.farmer.password.startswith('pbkdf2_sha256$'))
+
+    def test_benchmark_logins_command(self):
+        """Test that the login benchmark reports every configuration and leaves no user behind."""
+        out = StringIO()
+        call_command(
+            'benchmark_logins', '--logins', '1', '--pbkdf2-iterations', '1000', '2000',
+            '--scrypt-work-factor', '1024', stdout=out,
+        )
+        self.assertIn('iterations=2000', out.getvalue())
+        self.assertIn('work_factor=1024', out.getvalue())
+        self.assertFalse(User.objects.filter(username='benchmark_login').exists())
+
     def test_get_own_user_profile(self):
         """Test that a user can retrieve their own profile."""
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
@@ -164,6 +296,112 @@ class UserTests(APITestCase):
         self.assertEqual(response.data['username'], 'buyer1')
         self.assertEqual(response.data['email'], 'buyer1@example.com')
 
+    def test_get_user_profile_query_count(self):
+        """Test that fetching a profile costs a fixed number of queries."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        url = reverse('users:user-view', kwargs={'version': 'v1', 'pk': self.farmer.id})
+        self.client.get(url)  # warm the content type cache
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['profile']['role'], 'farmer')
+
+    def test_get_user_profile_products(self):
+        """Test that a profile links to the user's products and embeds a bounded page on request."""
+        category = Category.objects.create(name='Vegetables')
+        for i in range(25):
+            product = Product.objects.create(
+                name=f'Product {i}', price=1.00, category=category, quantity_available=10,
+                harvest_date=date(2025, 8, 1), expiry_date=date(2025, 12, 1), farmer=self.farmer,
+            )
+            assign_perm('view_product', self.farmer, product)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.farmer)}')
+        url = reverse('users:user-view', kwargs={'version': 'v1', 'pk': self.farmer.id})
+        self.client.get(url)  # warm the content type cache
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.data['product_count'], 25)
+        self.assertNotIn('products', response.data)
+        page = self.client.get(response.data['products_url'])
+        self.assertEqual(len(page.data['results']), 20)
+        self.assertIsNotNone(page.data['next'])
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'embed': 'products', 'limit': 5})
+        self.assertEqual([product['name'] for product in response.data['products']], [f'Product {i}' for i in range(5)])
+        self.assertEqual(self.client.get(url, {'embed': 'products', 'limit': 500}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
+        buyer = self.client.get(reverse('users:user-view', kwargs={'version': 'v1', 'pk': self.buyer.id}))
+        self.assertEqual((buyer.data['product_count'], buyer.data['products_url']), (0, None))
+
+    def test_login_token_carries_role_claims(self):
+        """Test that login tokens carry the claims used to build the request user."""
+        token = AccessToken(self.authenticate(self.farmer))
+        self.assertEqual(token['role'], 'farmer')
+        self.assertEqual(token['username'], 'farmer1')
+        self.assertFalse(token['is_superuser'])
+        self.assertEqual(AccessToken(self.authenticate(self.buyer))['role'], 'buyer')
+
+    def login(self, user):
+        response = self.client.post(
+            reverse('users:token_obtain_pair', kwargs={'version': 'v1'}),
+            {'username': user.username, 'password': 'password123'}, format='json',
+        )
+        return response.data['refresh']
+
+    def refresh(self, token):
+        return self.client.post(reverse('users:refresh-view', kwargs={'version': 'v1'}), {'refresh': token}, format='json')
+
+    def blacklist_queries(self, queries):
+        return [query for query in queries if 'token_blacklist_blacklistedtoken' in query['sql'] and 'SELECT' in query['sql']]
+
+    @override_settings(TOKEN_BLACKLIST_FILTER_CAPACITY=1000)
+    def test_refresh_blacklist_filter(self):
+        """Test that the blacklist filter skips the lookup for fresh tokens but still rejects rotated ones."""
+        blacklist_filter.clear()
+        self.addCleanup(blacklist_filter.clear)
+        old = self.login(self.farmer)
+        self.refresh(old)  # loads the filter
+        current = self.login(self.farmer)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.refresh(current)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Only blacklisting the rotated token itself reads the table
+        self.assertEqual(len(self.blacklist_queries(queries)), 1)
+        self.assertEqual(self.refresh(old).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh(current).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Blacklisted through the ORM (e.g. the admin): another process's warm filter reloads
+        other = self.login(self.buyer)
+        jti = RefreshToken(other)['jti']
+        other_process = BlacklistFilter()
+        self.assertFalse(other_process.might_contain(jti))
+        with self.captureOnCommitCallbacks(execute=True):
+            BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=jti))
+        self.assertTrue(other_process.might_contain(jti))
+        self.assertEqual(self.refresh(other).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        """Test that every added value is found and false positives stay near the target rate."""
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        self.assertLess(sum(f'other-{i}' in bloom for i in range(10000)), 300)
+
+    def test_prune_token_blacklist_command(self):
+        """Test that expired tokens and their blacklist entries are pruned in batches."""
+        now = timezone.now()
+        for i in range(5):
+            token = OutstandingToken.objects.create(
+                user=self.buyer, jti=f'jti-{i}', token='x', created_at=now, expires_at=now + timedelta(days=i - 2.5),
+            )
+            BlacklistedToken.objects.create(token=token)
+        out = StringIO()
+        call_command('prune_token_blacklist', '--batch-size', '2', stdout=out)
+        self.assertIn('Pruned 3 expired refresh tokens.', out.getvalue())
+        self.assertEqual(sorted(OutstandingToken.objects.values_list('jti', flat=True)), ['jti-3', 'jti-4'])
+        self.assertEqual(BlacklistedToken.objects.count(), 2)
+
     # def test_get_other_user_profile_denied(self):
     #     """Test that a user cannot retrieve another user's profile without permission."""
     #     self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.authenticate(self.buyer)}')
@@ -217,4 +455,74 @@ class UserTests(APITestCase):
     #     self.assertEqual(profile.role, 'buyer')
     #     self.assertTrue(user.groups.filter(name='Buyers').exists())
     #     self.assertTrue(user.has_perm('auth.change_user', user))
-    #     self.assertTrue(Cart.objects.filter(buyer=user).exists())
\ No newline at end of file
+    #     self.assertTrue(Cart.objects.filter(buyer=user).exists())
+
+
+class ObjectPermissionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.farmer = User.objects.create_user(username='farmer1', password='password123')
+        self.other = User.objects.create_user(username='farmer2', password='password123')
+        self.group = Group.objects.create(name='Reviewers')
+        category = Category.objects.create(name='Vegetables')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', description='Produce', price=5.00, category=category,
+                quantity_available=10, harvest_date=date(2025, 8, 1),
+                expiry_date=date(2025, 12, 1), farmer=self.farmer
+            )
+            for i in range(10)
+        ]
+        for product in self.products:
+            assign_perm('change_product', self.farmer, product)
+        ContentType.objects.get_for_model(Product)  # warm the content type cache
+
+    def test_prefetch_checks_many_objects_in_constant_queries(self):
+        """Test that N object checks cost the same two queries after a prefetch."""
+        checker = CachedObjectPermissionChecker(self.farmer)
+        with self.assertNumQueries(2):
+            checker.prefetch_perms(self.products)
+            for product in self.products:
+                self.assertTrue(checker.has_perm('products.change_product', product))
+                self.assertFalse(checker.has_perm('products.delete_product', product))
+
+    def test_checker_is_memoized_per_request(self):
+        """Test that repeated checks in one request reuse the same checker."""
+        request = RequestFactory().get('/')
+        request.user = self.farmer
+        checker = get_permission_checker(request)
+        self.assertIs(get_permission_checker(request), checker)
+        with self.assertNumQueries(2):
+            for _ in range(3):
+                self.assertTrue(get_permission_checker(request).has_perm('change_product', self.products[0]))
+
+    @override_settings(OBJECT_PERMISSION_CACHE_TTL=60)
+    def test_shared_cache_serves_later_checkers(self):
+        """Test that a fresh checker answers from the shared cache."""
+        CachedObjectPermissionChecker(self.farmer).prefetch_perms(self.products)
+        with self.assertNumQueries(0):
+            checker = CachedObjectPermissionChecker(self.farmer)
+            checker.prefetch_perms(self.products)
+            self.assertTrue(checker.has_perm('change_product', self.products[-1]))
+
+    @override_settings(OBJECT_PERMISSION_CACHE_TTL=60)
+    def test_shared_cache_invalidated_by_assign_and_remove(self):
+        """Test that assign_perm/remove_perm drop stale shared entries."""
+        product = self.products[0]
+        self.assertFalse(CachedObjectPermissionChecker(self.farmer).has_perm('delete_product', product))
+        assign_perm('delete_product', self.farmer, product)
+        self.assertTrue(CachedObjectPermissionChecker(self.farmer).has_perm('delete_product', product))
+        remove_perm('delete_product', self.farmer, product)
+        self.assertFalse(CachedObjectPermissionChecker(self.farmer).has_perm('delete_product', product))
+
+    @override_settings(OBJECT_PERMISSION_CACHE_TTL=60)
+    def test_shared_cache_invalidated_by_group_changes(self):
+        """Test that group permission and membership changes drop stale entries."""
+        product = self.products[0]
+        self.assertFalse(CachedObjectPermissionChecker(self.other).has_perm('view_product', product))
+        assign_perm('view_product', self.group, product)
+        self.assertFalse(CachedObjectPermissionChecker(self.other).has_perm('view_product', product))
+        self.other.groups.add(self.group)
+        self.assertTrue(CachedObjectPermissionChecker(self.other).has_perm('view_product', product))
+        remove_perm('view_product', self.group, product)
+        self.assertFalse(CachedObjectPermissionChecker(self.other).has_perm('view_product', product))
@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import RegisterView, UserView
+from .views import ProvisionView, RegisterView, UserView
 
 app_name = "users"
 urlpatterns = [
@@ -11,5 +11,6 @@ urlpatterns = [
 
     # Users
     path("users/<int:pk>/",UserView.as_view(),name="user-view"),
+    path("users/provision/",ProvisionView.as_view(),name="provision-view"),
 
 ]
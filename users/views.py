@@ -1,18 +1,18 @@
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import User, Group
 
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 
 from rest_framework.response import Response
 from rest_framework import status
 
 from drf_yasg.utils import swagger_auto_schema
-from guardian.shortcuts import assign_perm
 
-from carts.models import Cart
-from .serializers import RegisterSerializer, UserSerializer 
-from .models import UserProfile
+from config.eager_loading import EagerLoadingMixin
+from .provisioning import provision_users, register_user
+from .serializers import (
+    ProvisionResultSerializer, ProvisionSerializer, RegisterSerializer, UserQuerySerializer, UserSerializer,
+)
 
 User = get_user_model()
 
@@ -22,31 +22,45 @@ class RegisterView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = User.objects.create_user(
+            register_user(
                 username=serializer.validated_data['username'],
                 email=serializer.validated_data['email'],
-                password=serializer.validated_data['password']
+                password=serializer.validated_data['password'],
+                role=serializer.validated_data['role'],
             )
-            UserProfile.objects.create(user=user, role=serializer.validated_data['role'])
-            group_name = 'Farmers' if serializer.validated_data['role'] == 'farmer' else 'Buyers'
-            group = Group.objects.get(name=group_name)
-            user.groups.add(group)
-            assign_perm('change_user', user, user)
-            if serializer.validated_data['role'] == 'buyer':
-                Cart.objects.create(buyer=user)  # Create cart for buyers
             return Response({"detail": "User created successfully, please login"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserView(APIView):
+class UserView(EagerLoadingMixin, APIView):
     permission_classes = (IsAuthenticated,)
+    serializer_class = UserSerializer
+    @swagger_auto_schema(query_serializer=UserQuerySerializer, responses={200: UserSerializer})
     def get(self, request, pk, *args, **kwargs):
+        query = UserQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
         try:
-            user = User.objects.get(pk=pk)
+            user = self.eager_load(User.objects.all()).get(pk=pk)
             if not request.user.has_perm('auth.view_user', user):
                 return Response({"detail": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
-            data = UserSerializer(user).data
+            context = {'request': request}
+            if query.validated_data.get('embed') == 'products':
+                context['embed_products'] = query.validated_data['limit']
+            data = UserSerializer(user, context=context).data
             return Response(data, status=status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response({"detail": "No user found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+class ProvisionView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(request_body=ProvisionSerializer, responses={201: ProvisionResultSerializer})
+    def post(self, request, *args, **kwargs):
+        """Onboard a roster of users of one role, e.g. a cooperative's farmers."""
+        serializer = ProvisionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        created, skipped = provision_users(serializer.validated_data['users'], serializer.validated_data['role'])
+        data = ProvisionResultSerializer({'created': created, 'skipped': skipped}).data
+        return Response(data, status=status.HTTP_201_CREATED)